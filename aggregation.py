@@ -0,0 +1,200 @@
+import numpy as np
+import pandas as pd
+
+# Upper bounds on what a single chart sends to the browser
+MAX_CHART_PRODUCTS = 25
+MAX_CHART_POINTS = 1000
+
+def fold_tail(totals, limit=MAX_CHART_PRODUCTS):
+    """Keep the first limit - 1 rows of sorted product totals and fold the rest into "Other" """
+    if limit is not None and len(totals) > limit:
+        head, tail = totals.iloc[:limit - 1], totals.iloc[limit - 1:]
+        other = pd.DataFrame([{'product': 'Other', **tail.drop(columns='product').sum()}])
+        totals = pd.concat([head, other], ignore_index=True)
+    return totals
+
+def time_bucket(dates):
+    """Choose a daily, weekly or monthly bucket from the span of the dates"""
+    span = dates.max() - dates.min()
+    if span <= pd.Timedelta(days=90):
+        return 'D'
+    if span <= pd.Timedelta(days=730):
+        return 'W'
+    return 'MS'
+
+def bucketed_footprint(series):
+    """Resample a date-indexed footprint series for charting, downsampled to MAX_CHART_POINTS"""
+    series = series.resample(time_bucket(series.index)).sum()
+    if len(series) > MAX_CHART_POINTS:
+        keep = lttb_indices(series.index.asi8.astype(float), series.to_numpy(dtype=float), MAX_CHART_POINTS)
+        series = series.iloc[keep]
+    return series.reset_index()
+
+def lttb_indices(x, y, threshold):
+    """Indices of the points kept by Largest-Triangle-Three-Buckets downsampling"""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    bucket_size = (n - 2) / (threshold - 2)
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+
+    selected = 0
+    for i in range(threshold - 2):
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+
+        # Keep the point forming the largest triangle with the last kept point
+        # and the average of the next bucket
+        avg_x, avg_y = x[end:next_end].mean(), y[end:next_end].mean()
+        areas = np.abs(
+            (x[selected] - avg_x) * (y[start:end] - y[selected])
+            - (x[selected] - x[start:end]) * (avg_y - y[selected])
+        )
+        selected = start + int(np.argmax(areas))
+        indices[i + 1] = selected
+    return indices
+
+class RunningTotals:
+    """Per-product, per-category and per-day rollups that update in O(1) per transaction
+
+    Totals are plain dicts of [carbon_footprint, transactions, amount_cents], so
+    a rollup pickles cheaply and rollups built over separate chunks or workers
+    can be merged. Dashboard reads cost O(products + days), not O(history).
+    """
+
+    def __init__(self):
+        self.products = {}
+        self.categories = {}
+        self.days = {}
+        self.transactions = 0
+        self.total_footprint = 0.0
+        self.spend_cents = 0
+        self.top_product = ""
+        self.max_footprint = 0.0
+
+    @staticmethod
+    def _fold(totals, key, footprint, count, cents):
+        entry = totals.get(key)
+        if entry is None:
+            totals[key] = [footprint, count, cents]
+        else:
+            entry[0] += footprint
+            entry[1] += count
+            entry[2] += cents
+
+    def _fold_max(self, product, footprint):
+        # The first transaction with the highest footprint wins, as with idxmax
+        if self.transactions == 0 or footprint > self.max_footprint:
+            self.max_footprint = footprint
+            self.top_product = product
+
+    def update(self, df):
+        """Fold a chunk of transactions into the rollups, one vectorized pass over the chunk"""
+        if df.empty:
+            return
+
+        columns = {'carbon_footprint': 'sum', 'amount_cents': 'sum', 'product': 'size'}
+        groups = [
+            (self.products, df['product'].astype(str)),
+            (self.categories, df['category'].astype(str)),
+            (self.days, df['date'].dt.normalize())
+        ]
+        for totals, keys in groups:
+            grouped = df[['carbon_footprint', 'amount_cents', 'product']].groupby(keys, sort=False).agg(columns)
+            for key, footprint, cents, count in grouped.itertuples():
+                self._fold(totals, key, float(footprint), int(count), int(cents))
+
+        self._fold_max(df.loc[df['carbon_footprint'].idxmax(), 'product'], float(df['carbon_footprint'].max()))
+        self.transactions += len(df)
+        self.total_footprint += float(df['carbon_footprint'].sum())
+        self.spend_cents += int(df['amount_cents'].sum())
+
+    def merge(self, other):
+        """Fold another rollup into this one, as if its transactions came after these"""
+        for totals, other_totals in [
+            (self.products, other.products),
+            (self.categories, other.categories),
+            (self.days, other.days)
+        ]:
+            for key, (footprint, count, cents) in other_totals.items():
+                self._fold(totals, key, footprint, count, cents)
+
+        if other.transactions:
+            self._fold_max(other.top_product, other.max_footprint)
+        self.transactions += other.transactions
+        self.total_footprint += other.total_footprint
+        self.spend_cents += other.spend_cents
+        return self
+
+    @classmethod
+    def from_totals(cls, products, days, product_categories, top_product="", max_footprint=0.0):
+        """Rebuild a rollup from (key, carbon_footprint, transactions, amount_cents) rows"""
+        rollup = cls()
+        for product, footprint, count, cents in products:
+            rollup._fold(rollup.products, product, footprint, count, cents)
+            rollup._fold(rollup.categories, product_categories.get(product, ""), footprint, count, cents)
+            rollup.transactions += count
+            rollup.total_footprint += footprint
+            rollup.spend_cents += cents
+        for day, footprint, count, cents in days:
+            rollup._fold(rollup.days, pd.Timestamp(day), footprint, count, cents)
+        rollup.top_product = top_product
+        rollup.max_footprint = max_footprint
+        return rollup
+
+    def to_dict(self):
+        """JSON-serializable state, restored with from_dict"""
+        return {
+            "products": self.products,
+            "categories": self.categories,
+            "days": {day.strftime('%Y-%m-%d'): totals for day, totals in self.days.items()},
+            "transactions": self.transactions,
+            "total_footprint": self.total_footprint,
+            "spend_cents": self.spend_cents,
+            "top_product": self.top_product,
+            "max_footprint": self.max_footprint
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        rollup = cls()
+        rollup.__dict__.update(state)
+        rollup.days = {pd.Timestamp(day): totals for day, totals in state["days"].items()}
+        return rollup
+
+    def metrics(self):
+        """Headline dashboard metrics for everything folded in so far"""
+        return {
+            "total_footprint": self.total_footprint,
+            "mean_footprint": self.total_footprint / self.transactions if self.transactions else 0,
+            "transactions": self.transactions,
+            "unique_products": len(self.products),
+            "top_product": self.top_product,
+            "max_footprint": self.max_footprint,
+            "total_spend": self.spend_cents / 100
+        }
+
+    @staticmethod
+    def _frame(totals, key):
+        return pd.DataFrame(
+            [(name, *values) for name, values in totals.items()],
+            columns=[key, 'carbon_footprint', 'transactions', 'amount_cents']
+        ).sort_values(['carbon_footprint', key], ascending=[False, True]).reset_index(drop=True)
+
+    def product_totals(self, limit=MAX_CHART_PRODUCTS):
+        """Total footprint per product, highest first, with the tail folded into "Other" """
+        return fold_tail(self._frame(self.products, 'product'), limit)
+
+    def daily_totals(self):
+        """Total footprint, transactions and spend per day, in date order"""
+        return self._frame(self.days, 'date').sort_values('date', ignore_index=True)
+
+    def footprint_over_time(self):
+        """Total footprint per time bucket, bucket size chosen from the date range"""
+        if not self.days:
+            return pd.DataFrame(columns=['date', 'carbon_footprint'])
+        daily = pd.Series({day: totals[0] for day, totals in self.days.items()}, name='carbon_footprint')
+        return bucketed_footprint(daily.sort_index().rename_axis('date'))
@@ -7,31 +7,34 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-import pandas as pd
-import plotly.express as px
-import json
 import os
-from datetime import datetime
-import re
+from functools import partial, lru_cache, wraps
 import random
-from faker import Faker
-
-# Initialize Faker
-fake = Faker()
-
-# Define product data with categories and carbon footprint
-products_data = {
-    "Laptop": {"category": "Electronics", "base_footprint": 300},
-    "Smartphone": {"category": "Electronics", "base_footprint": 100},
-    "Headphones": {"category": "Electronics", "base_footprint": 30},
-    "Smartwatch": {"category": "Electronics", "base_footprint": 50},
-    "Tablet": {"category": "Electronics", "base_footprint": 150},
-    "Camera": {"category": "Electronics", "base_footprint": 80},
-    "Coffee Maker": {"category": "Appliances", "base_footprint": 120},
-    "Air Purifier": {"category": "Appliances", "base_footprint": 200},
-    "Electric Kettle": {"category": "Appliances", "base_footprint": 60},
-    "Vacuum Cleaner": {"category": "Appliances", "base_footprint": 180}
-}
+import hashlib
+from catalog import products_data, lower_footprint_alternatives
+from ingestion import EMAIL_EXTENSIONS, iter_uploaded_emails, iter_chunks
+from lazy_imports import lazy_import
+import instrumentation
+
+# Heavy modules load on first use, so pages that never touch data start fast
+pd = lazy_import("pandas")
+px = lazy_import("plotly.express")
+extraction = lazy_import("extraction")
+transaction_store = lazy_import("transaction_store")
+inference = lazy_import("inference")
+aggregation = lazy_import("aggregation")
+table_view = lazy_import("table_view")
+user_store = lazy_import("user_store")
+
+# Uploaded emails are parsed in chunks so memory is bounded by chunk size, not upload size
+EMAIL_CHUNK_SIZE = 50000
+PREVIEW_EMAILS = 20
+
+# Cached results are keyed on input content; old entries are evicted past this count
+CACHE_ENTRIES = 32
+
+# Lowest-footprint alternatives shown per product
+MAX_SUGGESTIONS = 5
 
 # Custom CSS
 st.markdown("""
@@ -100,13 +103,20 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-def generate_sample_email():
+@lru_cache(maxsize=None)
+def get_fake():
+    """Create the shared Faker instance on first use"""
+    from faker import Faker
+    return Faker()
+
+def generate_sample_email(rng=random, faker=None):
     """Generate a sample email for demonstration"""
-    product = random.choice(list(products_data.keys()))
-    customer_name = fake.name()
-    order_id = fake.uuid4()
-    amount = f"${random.uniform(20, 2000):.2f}"
-    date = fake.date_this_year().strftime("%Y-%m-%d")
+    faker = faker or get_fake()
+    product = rng.choice(list(products_data.keys()))
+    customer_name = faker.name()
+    order_id = faker.uuid4()
+    amount = f"${rng.uniform(20, 2000):.2f}"
+    date = faker.date_this_year().strftime("%Y-%m-%d")
 
     return (
         f"Hello {customer_name},\n\n"
@@ -116,46 +126,42 @@ def generate_sample_email():
         "Best Regards,\nSales Team"
     )
 
-def extract_entities(text):
-    """Extract entities from text using rule-based approach"""
-    entities = {
-        "Product_Name": "",
-        "Amount": "",
-        "Date": "",
-        "Order_ID": ""
-    }
-    
-    # Extract product name
-    for product in products_data.keys():
-        if product in text:
-            entities["Product_Name"] = product
-            break
-    
-    # Extract amount
-    amount_pattern = r'\$\d+(?:\.\d{2})?'
-    amount_match = re.search(amount_pattern, text)
-    if amount_match:
-        entities["Amount"] = amount_match.group()
-    
-    # Extract date
-    date_pattern = r'\d{4}-\d{2}-\d{2}'
-    date_match = re.search(date_pattern, text)
-    if date_match:
-        entities["Date"] = date_match.group()
-    
-    # Extract order ID
-    order_pattern = r'order ID is ([A-Za-z0-9-]+)'
-    order_match = re.search(order_pattern, text)
-    if order_match:
-        entities["Order_ID"] = order_match.group(1)
+def cached_data(name, **cache_options):
+    """st.cache_data that also counts requests and misses for the cache"""
+    def decorate(function):
+        @wraps(function)
+        def on_miss(*args, **kwargs):
+            instrumentation.increment("cache_misses_total", cache=name)
+            return function(*args, **kwargs)
+        
+        cached = st.cache_data(**cache_options)(on_miss)
+        
+        @wraps(function)
+        def call(*args, **kwargs):
+            instrumentation.increment("cache_requests_total", cache=name)
+            return cached(*args, **kwargs)
+        
+        call.clear = cached.clear
+        return call
+    return decorate
+
+@cached_data("sample_emails", max_entries=CACHE_ENTRIES, show_spinner=False)
+def generate_sample_emails(num_samples, seed):
+    """Generate a reproducible list of sample emails from a seed"""
+    from faker import Faker
     
-    return entities
+    rng = random.Random(seed)
+    faker = Faker()
+    faker.seed_instance(seed)
+    return [generate_sample_email(rng, faker) for _ in range(num_samples)]
 
-def calculate_carbon_footprint(product_name):
-    """Calculate carbon footprint for a product"""
-    if product_name in products_data:
-        return products_data[product_name]["base_footprint"]
-    return 0
+def hash_uploads(uploaded_files):
+    """Return a content hash identifying a set of uploaded files"""
+    digest = hashlib.sha256()
+    for uploaded_file in uploaded_files:
+        digest.update(uploaded_file.name.encode('utf-8'))
+        digest.update(uploaded_file.getbuffer())
+    return digest.hexdigest()
 
 def create_plotly_theme():
     """Create a consistent theme for Plotly charts"""
@@ -177,145 +183,331 @@ def create_plotly_theme():
             }
         }
     }
-def process_emails(emails):
-    """Process list of emails and return transactions"""
-    all_transactions = []
+
+@cached_data("process_emails", max_entries=CACHE_ENTRIES, show_spinner='Processing emails...')
+def process_emails(emails, _workers=None):
+    """Process list of emails and return transactions DataFrame"""
+    with instrumentation.timer("process_emails"):
+        return extraction.extract_transactions_parallel(emails, workers=_workers)
+
+def get_transaction_store():
+    """Return this session's connection to the persistent transaction store"""
+    if 'transaction_store' not in st.session_state:
+        st.session_state.transaction_store = transaction_store.connect()
+    return st.session_state.transaction_store
+
+@st.cache_resource
+def get_user_store():
+    """One user store for every session, so they share its connection pool and lookup cache"""
+    return user_store.UserStore()
+
+def signed_in_user():
+    return st.session_state.get('username')
+
+def record_upload(key, transactions, hashes):
+    """Add an upload to the signed-in user's history, or to this session's uploads, once per session"""
+    username = signed_in_user()
+    # Anonymous sessions keep the hashes of their emails, so Analysis reads back only their rows
+    st.session_state.setdefault('upload_hashes', set()).update(hashes)
+    recorded = st.session_state.setdefault('recorded_uploads', set())
+    if username and len(transactions) and (username, key) not in recorded:
+        get_user_store().add_transactions(username, transactions)
+        recorded.add((username, key))
+
+def session_transactions():
+    """Stored transactions of the emails uploaded in this session"""
+    return transaction_store.load_transactions(
+        get_transaction_store(), sorted(st.session_state.get('upload_hashes', ()))
+    )
+
+def transactions_between(transactions, start=None, end=None):
+    """Dated transactions in an inclusive date range, like the stores' date-range reads"""
+    dates = transactions['date']
+    in_range = dates.notna()
+    if start is not None:
+        in_range &= dates >= pd.Timestamp(start)
+    if end is not None:
+        in_range &= dates < pd.Timestamp(end) + pd.Timedelta(days=1)
+    return transactions[in_range]
+
+@st.cache_resource(show_spinner='Loading email parser model...')
+def get_ner_model():
+    """Load the trained NER model once and share it across sessions"""
+    return inference.load_ner_model()
+
+def iter_upload_transactions(uploaded_files, workers=None, use_ner=False):
+    """Store uploaded emails in chunks, yielding each chunk with its email hashes and transactions"""
+    conn = get_transaction_store()
+    # The model runs in as many processes as the rules do
+    extract = (
+        partial(inference.extract_transactions_hybrid, load_model=get_ner_model, n_process=workers or 1)
+        if use_ner else extraction.extract_transactions_parallel
+    )
+    seen = set()
+    for chunk in iter_chunks(iter_uploaded_emails(uploaded_files), EMAIL_CHUNK_SIZE):
+        # Emails already in the store are not parsed again
+        hashes = transaction_store.ingest_emails(conn, chunk, workers=workers, extract=extract)
+        new_hashes = [content_hash for content_hash in dict.fromkeys(hashes) if content_hash not in seen]
+        seen.update(new_hashes)
+        yield chunk, new_hashes, transaction_store.load_transactions(conn, new_hashes)
+
+def combine_transactions(frames):
+    """Concatenate per-chunk transactions, keeping the typed empty frame when there are none"""
+    if not frames:
+        return transaction_store.load_transactions(get_transaction_store(), [])
+    # The content hash index lets the user store skip emails already in a history
+    return pd.concat(frames)
+
+@cached_data("process_uploads", max_entries=CACHE_ENTRIES, show_spinner='Processing emails...')
+@instrumentation.timed("ingestion")
+def process_uploads(upload_hash, _uploaded_files, _workers=None, use_ner=False):
+    """Store uploaded emails in chunks and return their transactions, cached by content hash"""
+    preview = []
+    frames = []
+    hashes = []
+    for chunk, chunk_hashes, transactions in iter_upload_transactions(_uploaded_files, _workers, use_ner):
+        if len(preview) < PREVIEW_EMAILS:
+            preview.extend(chunk[:PREVIEW_EMAILS - len(preview)])
+        frames.append(transactions)
+        hashes.extend(chunk_hashes)
     
-    with st.spinner('Processing emails...'):
-        for email_content in emails:
-            entities = extract_entities(email_content)
-            
-            if entities["Product_Name"]:
-                carbon_footprint = calculate_carbon_footprint(entities["Product_Name"])
-                
-                transaction = {
-                    "date": entities["Date"],
-                    "product": entities["Product_Name"],
-                    "amount": entities["Amount"],
-                    "order_id": entities["Order_ID"],
-                    "carbon_footprint": carbon_footprint
-                }
-                
-                all_transactions.append(transaction)
+    return combine_transactions(frames), preview, hashes
+
+@instrumentation.timed("ingestion")
+def process_uploads_progressively(uploaded_files, workers=None, use_ner=False):
+    """Store uploaded emails in chunks, redrawing metrics and charts from running totals after each"""
+    # Drawn outside any cached function: st.cache_data would replay these
+    # elements into a placeholder that no longer exists on the next run
+    placeholder = st.empty()
+    totals = aggregation.RunningTotals()
+    preview = []
+    frames = []
+    hashes = []
+    emails = 0
+    for number, (chunk, chunk_hashes, transactions) in enumerate(
+        iter_upload_transactions(uploaded_files, workers, use_ner)
+    ):
+        if len(preview) < PREVIEW_EMAILS:
+            preview.extend(chunk[:PREVIEW_EMAILS - len(preview)])
+        frames.append(transactions)
+        hashes.extend(chunk_hashes)
+        emails += len(chunk)
+        totals.update(transactions)
+        
+        with placeholder.container():
+            st.caption(f"⏳ Processed {emails} emails so far...")
+            if totals.transactions:
+                display_metrics(totals.metrics())
+                display_charts(
+                    *build_charts(totals.product_totals(), totals.footprint_over_time()),
+                    key=f"progress_{number}"
+                )
+    
+    placeholder.empty()
+    return combine_transactions(frames), preview, hashes
+
+@cached_data("prepare_analysis", max_entries=CACHE_ENTRIES, show_spinner=False)
+def prepare_analysis(transactions):
+    """Compute the derived DataFrames, metrics and figures for the dashboard"""
+    with instrumentation.timer("dataframe"):
+        df = pd.DataFrame(transactions)
+        rollup = aggregation.RunningTotals()
+        rollup.update(df)
+    
+    return {
+        "rollup": rollup,
+        "display_df": df,
+        "footprint_quantiles": table_view.footprint_quantiles(df['carbon_footprint'])
+    }
+
+@cached_data("charts", max_entries=CACHE_ENTRIES, show_spinner=False)
+def prepare_charts(product_totals, trend):
+    """Build the dashboard figures, cached on the aggregates they are drawn from"""
+    with instrumentation.timer("charts"):
+        return build_charts(product_totals, trend)
+
+def build_charts(product_totals, trend=None):
+    """Build the product impact and trend figures from aggregated transactions"""
+    # Product Impact Chart
+    fig1 = px.bar(
+        product_totals,
+        x='product',
+        y='carbon_footprint',
+        title='Carbon Footprint by Product',
+        color='carbon_footprint',
+        color_continuous_scale='viridis',
+        hover_data=['transactions']
+    )
+    fig1.update_layout(**create_plotly_theme()['layout'])
     
-    return all_transactions
+    # Time Series Chart
+    fig2 = None
+    if trend is not None:
+        fig2 = px.line(
+            trend,
+            x='date',
+            y='carbon_footprint',
+            title='Carbon Footprint Trend',
+            markers=len(trend) <= 100,
+            render_mode='webgl' if len(trend) > 100 else 'auto'
+        )
+        fig2.update_layout(**create_plotly_theme()['layout'])
+    
+    return fig1, fig2
+
+# Columns of the transaction table; stored histories are sorted in SQL, where category is not stored
+TABLE_COLUMNS = ['date', 'product', 'category', 'amount', 'order_id', 'carbon_footprint']
+STORED_SORT_COLUMNS = [column for column in TABLE_COLUMNS if column != 'category']
+
+def frame_page_loader(df):
+    """Page loader over an in-memory DataFrame, with the same arguments as the stores' load_page"""
+    def load_page(products, sort_by, ascending, page, page_size):
+        page_df, _ = table_view.table_page(
+            df,
+            products=products,
+            sort_by=sort_by,
+            ascending=ascending,
+            page=page,
+            page_size=page_size,
+            sort_keys={'amount': 'amount_cents'}
+        )
+        return page_df
+    return load_page
+
+def rollup_quantiles(rollup):
+    """Footprint color bands from per-product totals; every transaction of a product has its footprint"""
+    totals = list(rollup.products.values())
+    return table_view.footprint_quantiles(
+        [footprint / count for footprint, count, _ in totals],
+        weights=[count for _, count, _ in totals]
+    )
+
+@instrumentation.timed("table")
+def display_transaction_table(rollup, quantiles, load_page, sort_columns=TABLE_COLUMNS):
+    """Display one server-side filtered, sorted page of the transactions"""
+    col1, col2, col3, col4 = st.columns([3, 2, 1, 1])
+    with col1:
+        products = st.multiselect("Filter by product", sorted(rollup.products))
+    with col2:
+        sort_by = st.selectbox("Sort by", sort_columns, index=sort_columns.index('carbon_footprint'))
+    with col3:
+        ascending = st.radio("Order", ["Descending", "Ascending"]) == "Ascending"
+    with col4:
+        page_size = st.selectbox("Rows per page", table_view.PAGE_SIZES, index=1)
+    
+    # Row counts come from the rollup and only the requested page is read, so
+    # render cost is bounded by page size
+    rows = sum(rollup.products[product][1] for product in products) if products else rollup.transactions
+    page = st.number_input("Page", min_value=1, max_value=table_view.page_count(rows, page_size), value=1)
+    page_df = load_page(products, sort_by, ascending, page, page_size)
+    
+    # Amounts and dates are formatted for the visible rows only
+    page_df = page_df.assign(amount=page_df['amount_cents'] / 100)[TABLE_COLUMNS]
+    styled_df = page_df.style.map(
+        lambda value: table_view.footprint_style(value, quantiles),
+        subset=['carbon_footprint']
+    ).format({
+        'date': lambda value: value.strftime('%Y-%m-%d') if pd.notna(value) else '',
+        'amount': '${:.2f}'
+    })
+    st.dataframe(styled_df, use_container_width=True)
+    
+    first = (page - 1) * page_size + 1 if rows else 0
+    st.caption(f"Showing {first}–{min(page * page_size, rows)} of {rows} transactions")
+
+def display_metrics(metrics):
+    """Display the Key Metrics tiles"""
+    st.markdown("### 📊 Key Metrics")
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        st.metric(
+            "Total Carbon Footprint",
+            f"{metrics['total_footprint']:.2f} kg CO2",
+            delta=f"{metrics['mean_footprint']:.2f} kg avg"
+        )
+    
+    with col2:
+        st.metric(
+            "Number of Transactions",
+            metrics['transactions'],
+            delta=f"{metrics['unique_products']} unique products"
+        )
+    
+    with col3:
+        st.metric(
+            "Highest Impact Product",
+            metrics['top_product'],
+            delta=f"{metrics['max_footprint']:.2f} kg CO2"
+        )
+    
+    with col4:
+        st.metric(
+            "Total Spend",
+            f"${metrics['total_spend']:.2f}",
+            delta="total"
+        )
+
+def display_charts(fig1, fig2, key=None):
+    """Display the product impact and trend charts side by side"""
+    st.markdown("### 📈 Visualization")
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        st.plotly_chart(fig1, use_container_width=True, key=key and f"{key}_products")
+    
+    with col2:
+        if fig2 is not None:
+            st.plotly_chart(fig2, use_container_width=True, key=key and f"{key}_trend")
 
 def display_analysis(transactions):
-    """Display the analysis dashboard"""
+    """Display the analysis dashboard for a DataFrame of transactions"""
+    if len(transactions) == 0:
+        return
+    
+    analysis = prepare_analysis(transactions)
+    display_dashboard(
+        analysis["rollup"],
+        analysis["footprint_quantiles"],
+        frame_page_loader(analysis["display_df"])
+    )
+
+def display_stored_analysis(rollup, load_page):
+    """Display the analysis dashboard for a stored history without reading the whole of it"""
+    display_dashboard(rollup, rollup_quantiles(rollup), load_page, sort_columns=STORED_SORT_COLUMNS)
+
+def display_dashboard(rollup, quantiles, load_page, sort_columns=TABLE_COLUMNS):
+    """Display metrics, charts, a paged transaction table and suggestions"""
     try:
-        if not transactions:
-            return
-        
-        df = pd.DataFrame(transactions)
-        
-        # Convert amount strings to numeric values for calculations
-        df['amount_numeric'] = df['amount'].str.replace('$', '').astype(float)
-        
-        # Get unique products count
-        unique_products = len(df['product'].unique())
-        
-        # Metrics row
-        st.markdown("### 📊 Key Metrics")
-        col1, col2, col3, col4 = st.columns(4)
-        
-        with col1:
-            st.metric(
-                "Total Carbon Footprint",
-                f"{df['carbon_footprint'].sum():.2f} kg CO2",
-                delta=f"{df['carbon_footprint'].mean():.2f} kg avg"
-            )
-        
-        with col2:
-            st.metric(
-                "Number of Transactions",
-                len(df),
-                delta=f"{unique_products} unique products"
-            )
-        
-        with col3:
-            st.metric(
-                "Highest Impact Product",
-                df.loc[df['carbon_footprint'].idxmax(), 'product'],
-                delta=f"{df['carbon_footprint'].max():.2f} kg CO2"
-            )
-        
-        with col4:
-            st.metric(
-                "Total Spend",
-                f"${df['amount_numeric'].sum():.2f}",
-                delta="total"
-            )
-        
-        # Charts
-        st.markdown("### 📈 Visualization")
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            # Product Impact Chart
-            fig1 = px.bar(
-                df,
-                x='product',
-                y='carbon_footprint',
-                title='Carbon Footprint by Product',
-                color='carbon_footprint',
-                color_continuous_scale='viridis'
-            )
-            fig1.update_layout(**create_plotly_theme()['layout'])
-            st.plotly_chart(fig1, use_container_width=True)
-        
-        with col2:
-            # Time Series Chart
-            if 'date' in df.columns:
-                df['date'] = pd.to_datetime(df['date'])
-                df_sorted = df.sort_values('date')
-                fig2 = px.line(
-                    df_sorted,
-                    x='date',
-                    y='carbon_footprint',
-                    title='Carbon Footprint Trend',
-                    markers=True
-                )
-                fig2.update_layout(**create_plotly_theme()['layout'])
-                st.plotly_chart(fig2, use_container_width=True)
+        # Metrics and charts are read from rollups, so their cost does not grow with history
+        display_metrics(rollup.metrics())
+        display_charts(*prepare_charts(rollup.product_totals(), rollup.footprint_over_time()))
         
         # Detailed Analysis
         st.markdown("### 🔍 Detailed Analysis")
         
         # Transaction Table (Full width)
         st.markdown("#### Transaction Details")
-        display_df = df.drop('amount_numeric', axis=1)
-        
-        styled_df = display_df.style.background_gradient(
-            subset=['carbon_footprint'],
-            cmap='RdYlGn_r'
-        )
-        
-        st.dataframe(styled_df, use_container_width=True)
+        display_transaction_table(rollup, quantiles, load_page, sort_columns)
         
         # Add some spacing
         st.markdown("<br>", unsafe_allow_html=True)
         
         # Sustainability Suggestions (Full width)
         st.markdown("#### 💡 Sustainability Suggestions")
-        high_impact_products = df.groupby('product')['carbon_footprint'].sum().sort_values(ascending=False)
         
-        for product, footprint in high_impact_products.items():
+        high_impact_products = rollup.product_totals(limit=None)['product']
+        for product in high_impact_products:
             with st.expander(f"Suggestions for {product}"):
-                lower_footprint_products = {
-                    k: v for k, v in products_data.items()
-                    if v['base_footprint'] < products_data[product]['base_footprint']
-                    and v['category'] == products_data[product]['category']
-                }
+                alternatives = lower_footprint_alternatives(product, limit=MAX_SUGGESTIONS)
                 
-                if lower_footprint_products:
+                if alternatives:
                     st.write("🌱 Alternative products with lower carbon footprint:")
-                    for alt_product, alt_data in lower_footprint_products.items():
-                        reduction = ((products_data[product]['base_footprint'] - alt_data['base_footprint']) 
-                                  / products_data[product]['base_footprint'] * 100)
+                    for alternative in alternatives:
                         st.markdown(f"""
-                            - **{alt_product}**
-                            - Potential reduction: `{reduction:.1f}%`
-                            - CO2 savings: `{products_data[product]['base_footprint'] - alt_data['base_footprint']:.1f} kg`
+                            - **{alternative['product']}**
+                            - Potential reduction: `{alternative['reduction']:.1f}%`
+                            - CO2 savings: `{alternative['savings']:.1f} kg`
                         """)
                 else:
                     st.success(f"✅ {product} is already among the lower carbon footprint options in its category.")
@@ -341,6 +533,43 @@ def main():
             label_visibility="collapsed"
         )
     
+        display_account()
+    
+    with instrumentation.request_scope(page):
+        show_page(page)
+
+def display_account():
+    """Sign-in form; a signed-in user's uploads build their own history"""
+    st.markdown("### Account")
+    if signed_in_user():
+        st.caption(f"Signed in as **{signed_in_user()}**")
+        if st.button("Sign out"):
+            del st.session_state.username
+            st.rerun()
+        return
+    
+    with st.form("account"):
+        username = st.text_input("Username")
+        password = st.text_input("Password", type="password")
+        email = st.text_input("Email", help="Only needed to register")
+        col1, col2 = st.columns(2)
+        sign_in = col1.form_submit_button("Sign in")
+        register = col2.form_submit_button("Register")
+    
+    if sign_in or register:
+        store = get_user_store()
+        with st.spinner("Checking credentials..."):
+            if register:
+                succeeded = store.register(username, password, email).result()
+            else:
+                succeeded = store.authenticate(username, password).result()
+        if succeeded:
+            st.session_state.username = username
+            st.rerun()
+        st.error("Enter a username and password; that username may be taken." if register else "Wrong username or password.")
+
+def show_page(page):
+    """Render the selected page"""
     if page == "Dashboard":
         # Sample data option with improved UI
         col1, col2 = st.columns([2, 1])
@@ -359,8 +588,10 @@ def main():
                     help="Select the number of sample emails to generate"
                 )
             
-            # Generate and process sample emails
-            sample_emails = [generate_sample_email() for _ in range(num_samples)]
+            # Sample emails come from a per-session seed so reruns reuse cached results
+            if 'sample_seed' not in st.session_state:
+                st.session_state.sample_seed = random.randrange(2**32)
+            sample_emails = generate_sample_emails(num_samples, st.session_state.sample_seed)
             all_transactions = process_emails(sample_emails)
             
             # Show sample emails in expandable sections
@@ -376,22 +607,51 @@ def main():
         st.markdown("### 📤 Upload Your Emails")
         
         uploaded_files = st.file_uploader(
-            "Upload your email files (text format)",
+            "Upload your email files (text, .eml, mbox or zip)",
             accept_multiple_files=True,
-            type=['txt'],
-            help="Select one or more text files containing email content"
+            type=[extension.lstrip('.') for extension in EMAIL_EXTENSIONS],
+            help="Select text files, .eml messages, mbox archives or zip bundles of them"
+        )
+        
+        workers = st.number_input(
+            "Worker processes",
+            min_value=1,
+            max_value=os.cpu_count() or 1,
+            value=os.cpu_count() or 1,
+            help="Large uploads are split into chunks and parsed in parallel"
+        )
+        
+        use_ner = st.checkbox(
+            "Use the trained model for emails the rules cannot parse",
+            value=os.path.isdir(inference.MODEL_DIR),
+            disabled=not os.path.isdir(inference.MODEL_DIR),
+            help="Run model_training.py to train the model"
+        )
+        
+        progressive = st.checkbox(
+            "Show results while processing",
+            value=True,
+            help="Update the metrics and charts after each chunk of a large upload"
         )
         
         if uploaded_files:
-            emails = []
-            for uploaded_file in uploaded_files:
-                email_content = uploaded_file.getvalue().decode('utf-8')
-                emails.append(email_content)
-            
-            all_transactions = process_emails(emails)
+            upload_hash = hash_uploads(uploaded_files)
+            if progressive:
+                # Keep the latest progressive result so reruns do not re-ingest
+                key = (upload_hash, use_ner)
+                if st.session_state.get('progressive_upload', (None,))[0] != key:
+                    st.session_state.progressive_upload = (
+                        key, process_uploads_progressively(uploaded_files, workers, use_ner)
+                    )
+                all_transactions, preview, hashes = st.session_state.progressive_upload[1]
+            else:
+                all_transactions, preview, hashes = process_uploads(
+                    upload_hash, uploaded_files, _workers=workers, use_ner=use_ner
+                )
+            record_upload(upload_hash, all_transactions, hashes)
             
             with st.expander("📧 View Uploaded Emails", expanded=False):
-                for i, email in enumerate(emails, 1):
+                for i, email in enumerate(preview, 1):
                     st.markdown(f"**Email {i}**")
                     st.text_area("", email, height=100, key=f"uploaded_email_{i}")
         else:
@@ -400,9 +660,35 @@ def main():
     
     elif page == "Analysis":
         st.markdown("### 📊 Detailed Analysis")
-        if 'all_transactions' not in locals() or not all_transactions:
-            st.warning("No data available for analysis. Please generate sample data or upload emails.")
+        if signed_in_user():
+            # Per-user rollups are read by key, however many users share the store
+            store = get_user_store()
+            rollup = store.load_rollup(signed_in_user())
+            load = partial(store.load_transactions, signed_in_user())
+            # The whole history is shown from its rollup, and the table pages through the store
+            show_history = partial(display_stored_analysis, rollup, partial(store.load_page, signed_in_user()))
+        else:
+            # The shared store holds every session's emails, so only this session's uploads are shown
+            transactions = session_transactions()
+            rollup = prepare_analysis(transactions)["rollup"]
+            load = partial(transactions_between, transactions)
+            show_history = partial(display_analysis, transactions)
+        if rollup.transactions == 0:
+            st.warning("No data available for analysis. Please upload emails to build your history.")
             return
+        
+        date_range = ()
+        if rollup.days:
+            first, last = min(rollup.days).date(), max(rollup.days).date()
+            date_range = st.date_input("Date range", (first, last), min_value=first, max_value=last)
+        if len(date_range) == 2 and tuple(date_range) != (first, last):
+            # Metrics for part of the history come from the transactions read for it
+            history = load(*date_range)
+            if len(history) == 0:
+                st.info("No transactions in this date range.")
+            display_analysis(history)
+        else:
+            show_history()
     
     elif page == "About":
         st.markdown("""
@@ -451,10 +737,10 @@ def main():
             
             #### Privacy Notice
             
-            Your email data is processed locally and is not stored or shared.
+            Your email data is processed locally and is never shared.
             We take your privacy seriously and implement the following measures:
             
-            - No data storage
+            - Extracted transactions are kept only in a local database
             - Local processing only
             - No external API calls
             - No tracking or analytics
@@ -501,7 +787,7 @@ def main():
     
     # Display analysis if there's data
     if any(page == p for p in ["Dashboard", "Upload Emails", "Analysis"]):
-        if 'all_transactions' in locals() and all_transactions:
+        if 'all_transactions' in locals() and len(all_transactions) > 0:
             display_analysis(all_transactions)
 
 if __name__ == "__main__":
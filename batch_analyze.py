@@ -0,0 +1,199 @@
+import os
+import sys
+import json
+import shutil
+import argparse
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from aggregation import RunningTotals
+from extraction import extract_transactions
+from ingestion import EMAIL_EXTENSIONS, iter_email_bodies
+
+CHECKPOINT_FILE = "checkpoint.json"
+DEFAULT_CHUNK_SIZE = 20000
+FILE_FORMATS = ["csv", "parquet"]
+AGGREGATES = ["products", "daily"]
+
+def find_email_files(paths):
+    """Expand files and directories into a sorted list of supported email files"""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                found.extend(
+                    os.path.join(root, name) for name in files
+                    if name.lower().endswith(EMAIL_EXTENSIONS)
+                )
+        else:
+            found.append(path)
+    return sorted(found)
+
+def iter_positioned_emails(files, position=(0, 0)):
+    """Yield (email, (file index, emails read from that file)) for every email after position"""
+    start_file, start_offset = position
+    for index in range(start_file, len(files)):
+        with open(files[index], "rb") as f:
+            skip = start_offset if index == start_file else 0
+            for offset, body in enumerate(iter_email_bodies(files[index], f), 1):
+                if offset > skip:
+                    yield body, (index, offset)
+
+def iter_email_chunks(files, position=(0, 0), chunk_size=DEFAULT_CHUNK_SIZE):
+    """Group emails into chunks, each with the position to resume from once it is saved"""
+    chunk = []
+    for body, position in iter_positioned_emails(files, position):
+        chunk.append(body)
+        if len(chunk) >= chunk_size:
+            yield chunk, position
+            chunk = []
+    if chunk:
+        yield chunk, position
+
+def extract_chunk(emails):
+    """Extract one chunk's transactions along with their rollup, in a worker process"""
+    transactions = extract_transactions(emails)
+    rollup = RunningTotals()
+    rollup.update(transactions)
+    return transactions, rollup
+
+def iter_extracted(chunks, workers=1):
+    """Extract transactions from chunks in a process pool, yielding results in input order"""
+    if workers <= 1:
+        for emails, position in chunks:
+            yield extract_chunk(emails), len(emails), position
+        return
+
+    # Keep a bounded number of chunks in flight so memory does not grow with the spool
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        pending = deque()
+        for emails, position in chunks:
+            pending.append((executor.submit(extract_chunk, emails), len(emails), position))
+            if len(pending) >= workers * 2:
+                future, count, done = pending.popleft()
+                yield future.result(), count, done
+        while pending:
+            future, count, done = pending.popleft()
+            yield future.result(), count, done
+
+def input_signature(files):
+    """[path, size, mtime] of every input, so renamed, rotated or appended files are noticed"""
+    signature = []
+    for path in files:
+        stat = os.stat(path)
+        signature.append([os.path.abspath(path), stat.st_size, stat.st_mtime_ns])
+    return signature
+
+def new_checkpoint(files, file_format):
+    return {
+        "inputs": input_signature(files),
+        "format": file_format,
+        "position": [0, 0],
+        "parts": 0,
+        "emails": 0,
+        "rollup": RunningTotals().to_dict(),
+        "complete": False
+    }
+
+def load_checkpoint(path, files, file_format):
+    """Load a saved checkpoint, or None if there is none or the inputs or output format changed"""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        checkpoint = json.load(f)
+    # A resume position only means something for the exact files it was taken over
+    if checkpoint.get("inputs") == input_signature(files) and checkpoint.get("format") == file_format:
+        return checkpoint
+    print(f"Inputs or output format changed since {path} was written; starting over")
+    return None
+
+def save_checkpoint(path, checkpoint):
+    """Atomically replace the checkpoint file"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+def write_table(df, path, file_format):
+    if file_format == "parquet":
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False, date_format="%Y-%m-%d")
+
+def write_aggregates(output_dir, rollup, file_format):
+    write_table(rollup.product_totals(limit=None), os.path.join(output_dir, f"products.{file_format}"), file_format)
+    write_table(rollup.daily_totals(), os.path.join(output_dir, f"daily.{file_format}"), file_format)
+
+def run_batch(paths, output_dir, file_format="csv", workers=None, chunk_size=DEFAULT_CHUNK_SIZE, restart=False):
+    """Analyze every email under paths, resuming from the checkpoint in output_dir"""
+    files = find_email_files(paths)
+    parts_dir = os.path.join(output_dir, "transactions")
+    checkpoint_path = os.path.join(output_dir, CHECKPOINT_FILE)
+    checkpoint = None if restart else load_checkpoint(checkpoint_path, files, file_format)
+    if checkpoint is None:
+        # Parts of an earlier run would be mixed into this one; the checkpoint goes first
+        # so an interrupted cleanup never leaves one pointing at removed parts
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        shutil.rmtree(parts_dir, ignore_errors=True)
+        for name in AGGREGATES:
+            for extension in FILE_FORMATS:
+                if os.path.exists(os.path.join(output_dir, f"{name}.{extension}")):
+                    os.remove(os.path.join(output_dir, f"{name}.{extension}"))
+        checkpoint = new_checkpoint(files, file_format)
+    os.makedirs(parts_dir, exist_ok=True)
+
+    if checkpoint["complete"]:
+        print(f"{output_dir} already holds a complete run; use --restart to redo it")
+        return checkpoint
+
+    rollup = RunningTotals.from_dict(checkpoint["rollup"])
+    chunks = iter_email_chunks(files, tuple(checkpoint["position"]), chunk_size)
+    for (transactions, chunk_rollup), emails, position in iter_extracted(chunks, workers or os.cpu_count() or 1):
+        if not transactions.empty:
+            # A part is written before the checkpoint that covers it, so a crash
+            # in between only rewrites the same part on resume
+            part = os.path.join(parts_dir, f"part-{checkpoint['parts']:05d}.{file_format}")
+            write_table(transactions.reset_index(drop=True), part, file_format)
+            checkpoint["parts"] += 1
+            rollup.merge(chunk_rollup)
+            checkpoint["rollup"] = rollup.to_dict()
+        checkpoint["emails"] += emails
+        checkpoint["position"] = list(position)
+        save_checkpoint(checkpoint_path, checkpoint)
+        print(f"{position[0] + 1}/{len(files)} files, {checkpoint['emails']} emails", file=sys.stderr)
+
+    write_aggregates(output_dir, rollup, file_format)
+    checkpoint["complete"] = True
+    save_checkpoint(checkpoint_path, checkpoint)
+    return checkpoint
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze a mail spool without the Streamlit app")
+    parser.add_argument("paths", nargs="+", help="email files, archives (.mbox, .zip) or directories")
+    parser.add_argument("--output-dir", default="batch_output")
+    parser.add_argument("--format", choices=FILE_FORMATS, default="csv")
+    parser.add_argument("--workers", type=int, default=None, help="process pool size (default: all CPUs)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="emails per extraction chunk")
+    parser.add_argument("--restart", action="store_true", help="discard the checkpoint and start over")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    checkpoint = run_batch(
+        args.paths,
+        args.output_dir,
+        file_format=args.format,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        restart=args.restart
+    )
+    transactions = checkpoint["rollup"]["transactions"]
+    print(f"{transactions} transactions in {checkpoint['parts']} parts written to {args.output_dir}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+from functools import partial
+
+import numpy as np
+
+from model_training import iter_sales_email_batches
+from extraction import extract_entities, extract_transactions, extract_transactions_parallel, template_cache
+from aggregation import RunningTotals
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+DEFAULT_OUTPUT = "bench_results.json"
+DEFAULT_BASELINE = os.path.join("benchmarks", "baseline.json")
+
+# Allowed relative slowdown before a stage counts as a regression
+DEFAULT_TOLERANCE = 0.2
+
+# Stages that took less than this in the baseline are too short to compare reliably
+MIN_COMPARED_SECONDS = 0.25
+
+# Transactions folded into the rollup at a time, as the Upload page does per chunk
+ROLLUP_CHUNK_SIZE = 50000
+
+# Each stage is timed this many times and its fastest run kept, so scheduling noise does not read as a regression
+DEFAULT_REPEAT = 3
+
+def build_corpus(size, seed=0):
+    """Bodies of a seeded synthetic corpus, generated in vectorized batches so millions are practical"""
+    return [email["email_content"] for batch in iter_sales_email_batches(size, seed=seed) for email in batch]
+
+def stage_result(emails, seconds, latencies_ns=None):
+    """Summarize one timed stage"""
+    result = {
+        "emails": emails,
+        "seconds": seconds,
+        "emails_per_sec": emails / seconds if seconds else None
+    }
+    if latencies_ns is not None:
+        result["p50_ms"] = float(np.percentile(latencies_ns, 50)) / 1e6
+        result["p99_ms"] = float(np.percentile(latencies_ns, 99)) / 1e6
+    return result
+
+def run_stage(bench, *args, repeat=DEFAULT_REPEAT, measure_memory=True, **kwargs):
+    """Time one stage from an empty template cache, then trace its peak memory in another run
+
+    tracemalloc slows the code it traces, so timings come from untraced
+    runs. Only this process is traced, not the parallel stage's workers.
+    """
+    runs = []
+    for _ in range(repeat):
+        template_cache.clear()
+        runs.append(bench(*args, **kwargs))
+    result = min(runs, key=lambda run: run["seconds"])
+    if measure_memory:
+        template_cache.clear()
+        tracemalloc.start()
+        try:
+            bench(*args, **kwargs)
+            result["peak_mb"] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        finally:
+            tracemalloc.stop()
+    return result
+
+def bench_extract_entities(emails):
+    """Time the one-email-at-a-time rule-based extractor"""
+    latencies = np.empty(len(emails), dtype=np.int64)
+    start = time.perf_counter()
+    for i, email_content in enumerate(emails):
+        t0 = time.perf_counter_ns()
+        extract_entities(email_content)
+        latencies[i] = time.perf_counter_ns() - t0
+    return stage_result(len(emails), time.perf_counter() - start, latencies)
+
+def bench_batch(function, emails, **kwargs):
+    """Time a batch extractor over the whole corpus"""
+    start = time.perf_counter()
+    function(emails, **kwargs)
+    return stage_result(len(emails), time.perf_counter() - start)
+
+def bench_rollup(transactions, chunk_size=ROLLUP_CHUNK_SIZE):
+    """Time folding extracted transactions into a rollup chunk by chunk and reading the dashboard from it"""
+    start = time.perf_counter()
+    rollup = RunningTotals()
+    for offset in range(0, len(transactions), chunk_size):
+        rollup.update(transactions.iloc[offset:offset + chunk_size])
+    rollup.metrics()
+    rollup.product_totals()
+    rollup.footprint_over_time()
+    return stage_result(len(transactions), time.perf_counter() - start)
+
+def run_benchmarks(sizes, workers=None, repeat=DEFAULT_REPEAT, measure_memory=True):
+    """Run every stage for each corpus size and return the results"""
+    results = {}
+    for size in sizes:
+        corpus = build_corpus(size)
+        transactions = extract_transactions(corpus)
+        stage = partial(run_stage, repeat=repeat, measure_memory=measure_memory)
+        stages = {
+            "extract_entities": stage(bench_extract_entities, corpus),
+            "extract_transactions": stage(bench_batch, extract_transactions, corpus),
+            "extract_transactions_parallel": stage(bench_batch, extract_transactions_parallel, corpus, workers=workers),
+            "rollup": stage(bench_rollup, transactions)
+        }
+        results[str(size)] = stages
+        print(f"{size} emails: " + ", ".join(
+            f"{name} {stage['seconds']:.3f}s" + (f" {stage['peak_mb']:.1f}MB" if "peak_mb" in stage else "")
+            for name, stage in stages.items()
+        ))
+    return results
+
+def find_regressions(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Compare results against a baseline and describe every stage that got slower"""
+    regressions = []
+    for size, stages in results.items():
+        for name, stage in stages.items():
+            reference = baseline.get(size, {}).get(name)
+            if not reference or reference["seconds"] < MIN_COMPARED_SECONDS:
+                continue
+            if stage["seconds"] > reference["seconds"] * (1 + tolerance):
+                regressions.append(
+                    f"{name} @ {size}: {stage['seconds']:.3f}s vs baseline {reference['seconds']:.3f}s"
+                )
+            if "p99_ms" in stage and "p99_ms" in reference and stage["p99_ms"] > reference["p99_ms"] * (1 + tolerance):
+                regressions.append(
+                    f"{name} @ {size}: p99 {stage['p99_ms']:.3f}ms vs baseline {reference['p99_ms']:.3f}ms"
+                )
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the email extraction and analysis pipeline")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="corpus sizes to benchmark, e.g. 1000 10000 1000000")
+    parser.add_argument("--workers", type=int, default=None, help="process pool size for the parallel stage")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="where to write the JSON results")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline results to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed relative slowdown before failing")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="timed runs per stage; the fastest is kept")
+    parser.add_argument("--no-memory", action="store_true", help="skip the traced run that measures peak memory")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run_benchmarks(
+        args.sizes, workers=args.workers, repeat=args.repeat, measure_memory=not args.no_memory
+    )
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "results": results
+    }
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if any(baseline.get(key) != report[key] for key in ("python", "machine", "cpus")):
+        print(
+            f"Baseline was recorded on {baseline.get('machine')} with {baseline.get('cpus')} CPUs and "
+            f"Python {baseline.get('python')}; rerun with --save-baseline to compare on this machine"
+        )
+    regressions = find_regressions(results, baseline["results"], args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+import os
+import csv
+from bisect import bisect_left
+
+PRODUCT_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "product_carbon_footprint.csv")
+ALIAS_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "product_aliases.csv")
+
+# Define product data with categories and carbon footprint
+DEFAULT_PRODUCTS = {
+    "Laptop": {"category": "Electronics", "base_footprint": 300},
+    "Smartphone": {"category": "Electronics", "base_footprint": 100},
+    "Headphones": {"category": "Electronics", "base_footprint": 30},
+    "Smartwatch": {"category": "Electronics", "base_footprint": 50},
+    "Tablet": {"category": "Electronics", "base_footprint": 150},
+    "Camera": {"category": "Electronics", "base_footprint": 80},
+    "Coffee Maker": {"category": "Appliances", "base_footprint": 120},
+    "Air Purifier": {"category": "Appliances", "base_footprint": 200},
+    "Electric Kettle": {"category": "Appliances", "base_footprint": 60},
+    "Vacuum Cleaner": {"category": "Appliances", "base_footprint": 180}
+}
+
+# Other names receipts use for catalog products
+DEFAULT_ALIASES = {
+    "Notebook": "Laptop",
+    "MacBook": "Laptop",
+    "Mobile Phone": "Smartphone",
+    "Cell Phone": "Smartphone",
+    "Smart Phone": "Smartphone",
+    "iPhone": "Smartphone",
+    "Earbuds": "Headphones",
+    "Earphones": "Headphones",
+    "Headset": "Headphones",
+    "Smart Watch": "Smartwatch",
+    "iPad": "Tablet",
+    "Digital Camera": "Camera",
+    "Coffee Machine": "Coffee Maker",
+    "Espresso Machine": "Coffee Maker",
+    "Air Cleaner": "Air Purifier",
+    "Kettle": "Electric Kettle",
+    "Vacuum": "Vacuum Cleaner",
+    "Robot Vacuum": "Vacuum Cleaner"
+}
+
+def load_catalog(path=PRODUCT_CSV):
+    """Load the product catalog from a product,category,base_footprint CSV if it exists"""
+    if not os.path.exists(path):
+        return dict(DEFAULT_PRODUCTS)
+
+    with open(path, newline="", encoding="utf-8") as f:
+        return {
+            row["product"]: {"category": row["category"], "base_footprint": float(row["base_footprint"])}
+            for row in csv.DictReader(f)
+        }
+
+def load_aliases(catalog, path=ALIAS_CSV):
+    """Map every product name and alias to its catalog product, adding an alias,product CSV if it exists"""
+    aliases = {name: name for name in catalog}
+    aliases.update({alias: product for alias, product in DEFAULT_ALIASES.items() if product in catalog})
+    if os.path.exists(path):
+        with open(path, newline="", encoding="utf-8") as f:
+            aliases.update({
+                row["alias"]: row["product"] for row in csv.DictReader(f) if row["product"] in catalog
+            })
+    return aliases
+
+def build_category_index(catalog):
+    """Group products by category as parallel lists sorted by base footprint"""
+    index = {}
+    for name, data in sorted(catalog.items(), key=lambda item: item[1]["base_footprint"]):
+        footprints, names = index.setdefault(data["category"], ([], []))
+        footprints.append(data["base_footprint"])
+        names.append(name)
+    return index
+
+# Loaded once per process and shared by the app and the training pipeline
+products_data = load_catalog()
+category_index = build_category_index(products_data)
+
+def lower_footprint_alternatives(product, limit=None):
+    """Return same-category products with a lower footprint, lowest first, with their savings"""
+    base_footprint = products_data[product]["base_footprint"]
+    footprints, names = category_index[products_data[product]["category"]]
+
+    # Everything before the product's footprint in the sorted category is cheaper
+    end = bisect_left(footprints, base_footprint)
+    if limit is not None:
+        end = min(end, limit)
+
+    return [
+        {
+            "product": names[i],
+            "base_footprint": footprints[i],
+            "savings": base_footprint - footprints[i],
+            "reduction": (base_footprint - footprints[i]) / base_footprint * 100
+        }
+        for i in range(end)
+    ]
@@ -0,0 +1,196 @@
+import os
+import sys
+import json
+import uuid
+import argparse
+from datetime import timedelta
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+from extraction import TRANSACTION_FIELDS, product_dtype, category_dtype
+
+FILE_FORMATS = {"parquet": "parquet", "arrow": "ipc"}
+
+TRANSACTION_SCHEMA = pa.schema([
+    ("date", pa.timestamp("us")),
+    ("product", pa.string()),
+    ("category", pa.string()),
+    ("amount_cents", pa.int64()),
+    ("order_id", pa.string()),
+    ("carbon_footprint", pa.float64()),
+    ("month", pa.string())
+])
+
+# Directory layout month=YYYY-MM/, so date filters skip whole months; product filters
+# use row-group statistics instead, so the directory count does not grow with the catalog
+PARTITIONING = ds.partitioning(pa.schema([("month", pa.string())]), flavor="hive")
+
+# Columns stored in each file; the month comes from the directory name
+FILE_SCHEMA = TRANSACTION_SCHEMA.remove(TRANSACTION_SCHEMA.get_field_index("month"))
+
+# Every append adds a file per month; a month is rewritten as one file once it has this many
+COMPACT_FILES = 16
+
+# Compacted files are sorted by product, so each row group covers a narrow product range
+ROW_GROUP_SIZE = 65536
+
+# Arrow IPC files are memory-mapped, so reads of fixed-width columns do not copy
+MMAP_FILESYSTEM = pafs.LocalFileSystem(use_mmap=True)
+
+def transactions_table(df):
+    """Arrow table of typed transactions with the month partition column added"""
+    df = df[TRANSACTION_FIELDS].assign(
+        product=df["product"].astype(str),
+        category=df["category"].astype(str),
+        month=df["date"].dt.strftime("%Y-%m")
+    )
+    return pa.Table.from_pandas(df, schema=TRANSACTION_SCHEMA, preserve_index=False)
+
+def write_transactions(df, root, file_format="parquet"):
+    """Append typed transactions to a partitioned dataset under root"""
+    extension = "arrow" if file_format == "arrow" else file_format
+    ds.write_dataset(
+        transactions_table(df),
+        root,
+        format=FILE_FORMATS[file_format],
+        partitioning=PARTITIONING,
+        # A unique name per write appends new files next to the existing ones
+        basename_template=f"part-{uuid.uuid4().hex}-{{i}}.{extension}",
+        existing_data_behavior="overwrite_or_ignore"
+    )
+
+def write_file(table, path, file_format="parquet"):
+    if file_format == "arrow":
+        with ipc.new_file(path, table.schema) as writer:
+            writer.write_table(table, max_chunksize=ROW_GROUP_SIZE)
+    else:
+        pq.write_table(table, path, row_group_size=ROW_GROUP_SIZE)
+
+def compact_transactions(root, file_format="parquet", min_files=COMPACT_FILES):
+    """Rewrite each month directory holding min_files or more files as one file; return how many
+
+    The new file is written under an ignored name and renamed into place
+    before the files it replaces are removed, so a reader never sees a
+    month without its rows.
+    """
+    extension = "arrow" if file_format == "arrow" else file_format
+    if not os.path.isdir(root):
+        return 0
+
+    compacted = 0
+    for month in os.scandir(root):
+        if not month.is_dir() or not month.name.startswith("month="):
+            continue
+        paths = sorted(
+            entry.path for entry in os.scandir(month.path)
+            if entry.is_file() and not entry.name.startswith(("_", "."))
+        )
+        if len(paths) < min_files:
+            continue
+
+        table = ds.dataset(paths, schema=FILE_SCHEMA, format=FILE_FORMATS[file_format]).to_table()
+        name = f"part-{uuid.uuid4().hex}-0.{extension}"
+        tmp_path = os.path.join(month.path, f"_{name}")
+        write_file(table.sort_by([("product", "ascending"), ("date", "ascending")]), tmp_path, file_format)
+        os.replace(tmp_path, os.path.join(month.path, name))
+        for path in paths:
+            os.remove(path)
+        compacted += 1
+    return compacted
+
+def transactions_filter(start=None, end=None, products=None):
+    """Dataset filter for an inclusive date range and a set of products"""
+    conditions = []
+    if start is not None:
+        conditions.append(ds.field("month") >= start.strftime("%Y-%m"))
+        conditions.append(ds.field("date") >= pa.scalar(pd.Timestamp(start), pa.timestamp("us")))
+    if end is not None:
+        conditions.append(ds.field("month") <= end.strftime("%Y-%m"))
+        conditions.append(ds.field("date") < pa.scalar(pd.Timestamp(end + timedelta(days=1)), pa.timestamp("us")))
+    if products:
+        conditions.append(ds.field("product").isin(list(products)))
+
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+def read_transactions(root, columns=None, start=None, end=None, products=None, file_format="parquet"):
+    """Load only the requested columns, dates and products of a transactions dataset"""
+    columns = list(columns or TRANSACTION_FIELDS)
+    if not os.path.isdir(root):
+        return pd.DataFrame({column: pd.Series(dtype=object) for column in columns})
+
+    for attempt in range(2):
+        dataset = ds.dataset(
+            root,
+            schema=TRANSACTION_SCHEMA,
+            format=FILE_FORMATS[file_format],
+            partitioning=PARTITIONING,
+            filesystem=MMAP_FILESYSTEM
+        )
+        try:
+            table = dataset.to_table(columns=columns, filter=transactions_filter(start, end, products))
+            break
+        except FileNotFoundError:
+            # A compaction removed files after they were listed; the next listing has their rows
+            if attempt:
+                raise
+    df = table.to_pandas(split_blocks=True, self_destruct=True)
+    if "product" in df:
+        df["product"] = df["product"].astype(product_dtype)
+    if "category" in df:
+        df["category"] = df["category"].astype(category_dtype)
+    return df
+
+def write_corpus(emails, path, file_format="parquet"):
+    """Write labeled emails, a list of dicts or an iterable of such batches, to one columnar file"""
+    batches = [emails] if isinstance(emails, list) and emails and isinstance(emails[0], dict) else emails
+    writer = None
+    try:
+        for batch in batches:
+            table = pa.Table.from_pylist(batch)
+            if writer is None:
+                writer = (
+                    pq.ParquetWriter(path, table.schema) if file_format == "parquet"
+                    else ipc.new_file(path, table.schema)
+                )
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+def read_corpus(path, columns=None, filter=None):
+    """Load selected columns of a columnar corpus, memory-mapping Arrow files"""
+    file_format = "ipc" if path.endswith((".arrow", ".feather")) else "parquet"
+    dataset = ds.dataset(path, format=file_format, filesystem=MMAP_FILESYSTEM)
+    return dataset.to_table(columns=columns, filter=filter).to_pandas(split_blocks=True, self_destruct=True)
+
+def convert_json_corpus(json_path, output_path, file_format="parquet"):
+    """Convert a JSON list of labeled emails, like models/synthetic_sales_emails.json, to a columnar file"""
+    with open(json_path) as f:
+        emails = json.load(f)
+    write_corpus(emails, output_path, file_format)
+    return len(emails)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Convert a JSON email corpus to Parquet or Arrow")
+    parser.add_argument("json_path")
+    parser.add_argument("output_path", nargs="?", help="defaults to json_path with the format's extension")
+    parser.add_argument("--format", choices=list(FILE_FORMATS), default="parquet")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    output_path = args.output_path or os.path.splitext(args.json_path)[0] + f".{args.format}"
+    count = convert_json_corpus(args.json_path, output_path, args.format)
+    print(f"Wrote {count} emails to {output_path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+import sys
+import zlib
+import argparse
+from datetime import date
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import transaction_store
+from aggregation import RunningTotals
+
+EXPORT_TABLES = ("transactions", "products", "daily")
+EXPORT_FORMATS = ("csv", "jsonl", "parquet")
+EXPORT_CHUNK_SIZE = 50000
+
+CONTENT_TYPES = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+    "gzip": "application/gzip"
+}
+
+# Parquet compresses each row group itself, so only text formats are gzipped
+PARQUET_COMPRESSION = "zstd"
+GZIP_LEVEL = 6
+
+def iter_aggregates(conn, table, start=None, end=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield per-product or per-day totals in frames of at most chunk_size rows
+
+    The whole history is read from the stored rollups; a date range is folded
+    from transactions streamed chunk by chunk, so neither loads every row.
+    """
+    if start is None and end is None:
+        rollup = transaction_store.load_rollup(conn)
+    else:
+        rollup = RunningTotals()
+        for chunk in transaction_store.iter_transactions(conn, start, end, chunk_size):
+            rollup.update(chunk)
+    totals = rollup.product_totals(limit=None) if table == "products" else rollup.daily_totals()
+    for offset in range(0, max(len(totals), 1), chunk_size):
+        yield totals.iloc[offset:offset + chunk_size]
+
+def iter_frames(conn, table, start=None, end=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield one export table as DataFrames of at most chunk_size rows"""
+    if table == "transactions":
+        return transaction_store.iter_transactions(conn, start, end, chunk_size)
+    if table in ("products", "daily"):
+        return iter_aggregates(conn, table, start, end, chunk_size)
+    raise ValueError(f"unknown export table {table!r}, expected one of {', '.join(EXPORT_TABLES)}")
+
+def iter_csv(frames):
+    header = True
+    for frame in frames:
+        yield frame.to_csv(index=False, header=header, date_format="%Y-%m-%d").encode("utf-8")
+        header = False
+
+def iter_jsonl(frames):
+    for frame in frames:
+        if len(frame):
+            yield frame.to_json(orient="records", lines=True, date_format="iso").encode("utf-8")
+
+class ChunkSink:
+    """Write-only file object that hands back what was written since the last drain"""
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.parts)
+        self.parts.clear()
+        return data
+
+def iter_parquet(frames):
+    """One row group per frame, each yielded as soon as it is encoded"""
+    sink = ChunkSink()
+    writer = None
+    try:
+        for frame in frames:
+            if writer is not None and not len(frame):
+                continue
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(sink, table.schema, compression=PARQUET_COMPRESSION)
+            writer.write_table(table.cast(writer.schema))
+            yield sink.drain()
+    finally:
+        if writer is not None:
+            writer.close()
+    yield sink.drain()
+
+WRITERS = {"csv": iter_csv, "jsonl": iter_jsonl, "parquet": iter_parquet}
+
+def gzip_chunks(chunks, level=GZIP_LEVEL):
+    """Gzip a byte stream on the fly"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def export_chunks(conn, table, file_format="csv", start=None, end=None, compress=True,
+                  chunk_size=EXPORT_CHUNK_SIZE):
+    """Stream an export as byte chunks without building the whole file in memory"""
+    if file_format not in WRITERS:
+        raise ValueError(f"unknown export format {file_format!r}, expected one of {', '.join(EXPORT_FORMATS)}")
+    chunks = WRITERS[file_format](iter_frames(conn, table, start, end, chunk_size))
+    if compress and file_format != "parquet":
+        chunks = gzip_chunks(chunks)
+    return (chunk for chunk in chunks if chunk)
+
+def export_filename(table, file_format="csv", compress=True):
+    gzipped = compress and file_format != "parquet"
+    return f"{table}.{file_format}" + (".gz" if gzipped else "")
+
+def export_content_type(file_format="csv", compress=True):
+    return CONTENT_TYPES["gzip" if compress and file_format != "parquet" else file_format]
+
+def write_export(path, conn, table, file_format="csv", start=None, end=None, compress=True,
+                 chunk_size=EXPORT_CHUNK_SIZE):
+    """Stream an export to path or, for "-", to stdout; return the bytes written"""
+    output = sys.stdout.buffer if path == "-" else open(path, "wb")
+    written = 0
+    try:
+        for chunk in export_chunks(conn, table, file_format, start, end, compress, chunk_size):
+            output.write(chunk)
+            written += len(chunk)
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+    return written
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Export stored transactions or their totals")
+    parser.add_argument("table", choices=EXPORT_TABLES)
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    parser.add_argument("--start", type=date.fromisoformat, help="first date to include, YYYY-MM-DD")
+    parser.add_argument("--end", type=date.fromisoformat, help="last date to include, YYYY-MM-DD")
+    parser.add_argument("--no-compress", action="store_true", help="do not gzip CSV and JSONL output")
+    parser.add_argument("--output", help='defaults to the table name and extension; "-" for stdout')
+    parser.add_argument("--db", default=transaction_store.TRANSACTIONS_DB, help="transaction store to read")
+    parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE, help="rows read and written at a time")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    compress = not args.no_compress
+    output = args.output or export_filename(args.table, args.format, compress)
+    conn = transaction_store.connect(args.db)
+    try:
+        written = write_export(
+            output, conn, args.table, args.format, args.start, args.end, compress, args.chunk_size
+        )
+    finally:
+        conn.close()
+    if output != "-":
+        print(f"Wrote {written} bytes to {output}", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
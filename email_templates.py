@@ -0,0 +1,179 @@
+import re
+import threading
+
+# Layout fingerprints kept before the oldest is dropped
+MAX_LAYOUTS = 10000
+
+# Distinct templates, and learning attempts, allowed per fingerprint
+MAX_TEMPLATES_PER_LAYOUT = 4
+MAX_ATTEMPTS_PER_LAYOUT = 8
+
+FIELDS = ("Product_Name", "Amount", "Date", "Order_ID")
+EMPTY_ENTITIES = dict.fromkeys(FIELDS, "")
+
+# Letters, digits, spaces and non-ASCII bytes change between emails from one
+# template; the punctuation and line breaks left over fingerprint the layout
+VARIABLE_BYTES = bytes(
+    byte for byte in range(256) if byte >= 0x80 or chr(byte).isalnum() or chr(byte) in " \t"
+)
+
+WORD_PATTERN = re.compile(r"\w+(?:['-]\w+)*")
+
+# Text between two punctuation marks, such as a customer name
+VARIABLE_TEXT = r'[^\n.,;:!?()"]*?'
+
+def fingerprint(text):
+    """Punctuation and line structure of an email, computed in one C-level pass"""
+    return text.encode("utf-8", "surrogatepass").translate(None, VARIABLE_BYTES)
+
+def is_variable(word):
+    """Capitalized and numeric words, like names and IDs, differ between emails of a template"""
+    return not word.islower() or any(char.isdigit() for char in word)
+
+def layout_pattern(segment):
+    """Regex source for text between fields: lowercase words literal, runs of other words wildcards"""
+    tokens = []
+    position = 0
+    for match in WORD_PATTERN.finditer(segment):
+        separator = segment[position:match.start()]
+        position = match.end()
+        if is_variable(match.group()):
+            # "John Smith" and "Mary Ann Lee" collapse into one wildcard
+            if tokens and tokens[-1] is VARIABLE_TEXT and not separator.strip(" \t"):
+                continue
+            tokens.extend([re.escape(separator), VARIABLE_TEXT])
+        else:
+            tokens.append(re.escape(separator + match.group()))
+    tokens.append(re.escape(segment[position:]))
+    return "".join(tokens)
+
+def field_span(text, value):
+    """Span of value's first occurrence in text that does not start or end inside a word, or None
+
+    "Laptop" in "the Laptops." is skipped, so no template ends its product
+    group in the middle of a word.
+    """
+    pattern = re.escape(value)
+    if WORD_PATTERN.match(value[:1]):
+        pattern = r"(?<!\w)" + pattern
+    if WORD_PATTERN.match(value[-1:]):
+        pattern += r"(?!\w)"
+    match = re.search(pattern, text)
+    return match.span() if match else None
+
+def template_pattern(text, spans, field_patterns):
+    """Compiled extractor for text's template, with each field's span as a named group"""
+    source = []
+    position = 0
+    for field, (start, end) in sorted(spans.items(), key=lambda item: item[1]):
+        source.append(layout_pattern(text[position:start]))
+        source.append(f"(?P<{field}>{field_patterns[field]})")
+        position = end
+    return re.compile("".join(source))
+
+class TemplateCache:
+    """Sender templates learned from extracted emails, used to extract by position
+
+    Emails are grouped by the fingerprint of their punctuation and line
+    structure. Each fingerprint keeps a few compiled extractors learned
+    from emails the generic or NER extractors handled, so an email in a
+    known template costs a translate, a dict lookup and one anchored match;
+    the generic extractors only run for templates not seen before.
+    """
+
+    def __init__(self, field_patterns, resolve_product, product_mentions=None, max_layouts=MAX_LAYOUTS):
+        # field_patterns map each field to the regex source its group matches, and
+        # resolve_product maps a matched product mention to a catalog name or None.
+        # product_mentions, a compiled regex of catalog names, keeps emails naming
+        # another product, as in "Hello Tablet,", out of both learning and matching
+        self.field_patterns = field_patterns
+        self.resolve_product = resolve_product
+        self.product_mentions = product_mentions
+        self.max_layouts = max_layouts
+        self.templates = {}
+        self.attempts = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return sum(map(len, self.templates.values()))
+
+    def match(self, text, templates):
+        for pattern in templates:
+            match = pattern.match(text)
+            if match is None:
+                continue
+            # A catalog name ahead of the product slot is what the generic extractor
+            # reports, so the email goes to it and reads the same with or without templates
+            mentions = self.product_mentions
+            if mentions is not None and mentions.search(text, 0, match.start("Product_Name")):
+                return None
+            product = self.resolve_product(match["Product_Name"])
+            if product:
+                entities = match.groupdict()
+                entities["Product_Name"] = product
+                # Fields the template was learned without stay empty, as the generic extractor left them
+                return entities if len(entities) == len(FIELDS) else dict(EMPTY_ENTITIES, **entities)
+        return None
+
+    def extract(self, text, layout=None):
+        """Entities of an email in a known template, or None to use the generic extractors
+
+        layout is the email's fingerprint, for callers that already computed it.
+        """
+        templates = self.templates.get(fingerprint(text) if layout is None else layout)
+        if not templates:
+            return None
+        return self.match(text, templates)
+
+    def learn(self, text, entities):
+        """Learn the template of an email whose entities another extractor found
+
+        Entities are located by their first occurrence on word boundaries,
+        and the template is kept only if it extracts the same entities back
+        from the email. Emails naming more than one catalog product are
+        skipped, since which mention sits in the product slot is unknown.
+        """
+        if not entities.get("Product_Name"):
+            return False
+        key = fingerprint(text)
+        templates = self.templates.get(key, ())
+        if len(templates) >= MAX_TEMPLATES_PER_LAYOUT or self.attempts.get(key, 0) >= MAX_ATTEMPTS_PER_LAYOUT:
+            return False
+        if templates and self.match(text, templates):
+            return False
+
+        spans = {}
+        for field in FIELDS:
+            value = entities.get(field)
+            if value:
+                spans[field] = field_span(text, value)
+                if spans[field] is None:
+                    return False
+        if self.product_mentions is not None and any(
+            mention.span() != spans["Product_Name"] for mention in self.product_mentions.finditer(text)
+        ):
+            return False
+        ordered = sorted(spans.values())
+        if any(end > start for (_, end), (start, _) in zip(ordered, ordered[1:])):
+            return False
+
+        pattern = template_pattern(text, spans, self.field_patterns)
+        expected = {field: entities.get(field) or "" for field in FIELDS}
+        expected["Product_Name"] = self.resolve_product(expected["Product_Name"])
+        learned = self.match(text, [pattern])
+        with self._lock:
+            # Every fingerprint tried has an attempts entry, so its size bounds both dicts
+            if key not in self.attempts and len(self.attempts) >= self.max_layouts:
+                oldest = next(iter(self.attempts))
+                del self.attempts[oldest]
+                self.templates.pop(oldest, None)
+            self.attempts[key] = self.attempts.get(key, 0) + 1
+            if learned != expected:
+                return False
+            self.templates[key] = (*self.templates.get(key, ()), pattern)
+        return True
+
+    def clear(self):
+        with self._lock:
+            self.templates.clear()
+            self.attempts.clear()
@@ -0,0 +1,86 @@
+import os
+from functools import lru_cache
+
+from lazy_imports import lazy_import
+from product_resolver import default_resolver
+
+# Deferred so the app can check MODEL_DIR without importing pandas
+pd = lazy_import("pandas")
+extraction = lazy_import("extraction")
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "email_parser_model")
+
+NER_BATCH_SIZE = 256
+
+@lru_cache(maxsize=None)
+def load_ner_model(path=MODEL_DIR):
+    """Load the trained spaCy model once per process, or None if it is unavailable"""
+    if not os.path.isdir(path):
+        return None
+    try:
+        import spacy
+    except ImportError:
+        return None
+    return spacy.load(path)
+
+def ner_entities(doc):
+    """Collect the first entity of each label from a spaCy doc"""
+    entities = {"Product_Name": "", "Amount": "", "Date": "", "Order_ID": ""}
+    for ent in doc.ents:
+        if ent.label_ in entities and not entities[ent.label_]:
+            entities[ent.label_] = ent.text
+    return entities
+
+def ner_transactions(nlp, emails, n_process=1, batch_size=NER_BATCH_SIZE):
+    """Extract transactions from a Series of emails with the NER model"""
+    rows = {}
+    # Each process takes whole batches, so processes beyond the batch count would only load the model
+    n_process = max(1, min(n_process, -(-len(emails) // batch_size), os.cpu_count() or 1))
+    docs = nlp.pipe(emails.tolist(), batch_size=batch_size, n_process=n_process)
+    for index, text, doc in zip(emails.index, emails.tolist(), docs):
+        entities = ner_entities(doc)
+        # Model output is matched to the catalog the same way as receipt text
+        match = default_resolver().resolve_name(entities["Product_Name"])
+        if match is None:
+            continue
+        # The sender's layout is learned, so its next emails skip the model
+        extraction.template_cache.learn(text, entities)
+        product = match.product
+        try:
+            amount_cents = extraction.to_cents(entities["Amount"].replace(",", ""))
+        except ValueError:
+            amount_cents = 0
+        rows[index] = {
+            "date": entities["Date"],
+            "product": product,
+            "amount_cents": amount_cents,
+            "order_id": entities["Order_ID"]
+        }
+    return extraction.typed_transactions(pd.DataFrame.from_dict(
+        rows, orient="index", columns=["date", "product", "amount_cents", "order_id"]
+    ))
+
+def extract_transactions_hybrid(emails, load_model=load_ner_model, workers=None, n_process=1):
+    """Run the rule-based extractor first and send only the receipts it misses to the NER model"""
+    emails = pd.Series(emails, dtype=object)
+    transactions = extraction.extract_transactions_parallel(emails, workers=workers)
+
+    # As with the fuzzy resolver, only mail holding an amount or order ID can be a receipt,
+    # so a signature like "Sent from my iPhone" never reaches the model
+    misses = emails[~emails.index.isin(transactions.index)]
+    misses = misses[[extraction.anchor_pattern.search(text) is not None for text in misses.tolist()]]
+    if misses.empty:
+        return transactions
+
+    # The model is only loaded once some email actually needs it
+    nlp = load_model()
+    if nlp is None:
+        return transactions
+
+    recovered = ner_transactions(nlp, misses, n_process=n_process)
+    if recovered.empty:
+        return transactions
+
+    # Restore the order of the input emails
+    combined = pd.concat([transactions, recovered])
+    return combined.loc[emails.index.intersection(combined.index, sort=False)]
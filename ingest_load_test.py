@@ -0,0 +1,102 @@
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+import numpy as np
+
+from ingest_server import DEFAULT_PORT
+from model_training import iter_sales_email_batches
+
+async def post(reader, writer, host, path, payload):
+    """Send one keep-alive POST and return (status, parsed body)"""
+    body = json.dumps(payload).encode()
+    writer.write(
+        f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+    )
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+async def run_connection(host, port, requests, latencies, outcomes, failed):
+    """Send queued requests over one connection, retrying only those rejected with 503
+
+    Any other error, such as 413 for a request larger than the server's
+    queue, would come back the same on every retry, so it is given up on.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while requests:
+            emails = requests.pop()
+            while True:
+                start = time.perf_counter()
+                status, body = await post(reader, writer, host, "/emails", {"emails": emails})
+                outcomes[status] = outcomes.get(status, 0) + 1
+                if status == 200:
+                    latencies.append(time.perf_counter() - start)
+                    break
+                if status != 503:
+                    failed.append(len(emails))
+                    print(f"Gave up on {len(emails)} emails: {status} {body.get('error', '')}", file=sys.stderr)
+                    break
+                # Back off as the server asks when it is saturated
+                await asyncio.sleep(1)
+    finally:
+        writer.close()
+
+async def load_test(host, port, emails, per_request, concurrency):
+    requests = [emails[i:i + per_request] for i in range(0, len(emails), per_request)]
+    requests.reverse()
+    latencies = []
+    outcomes = {}
+    failed = []
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        run_connection(host, port, requests, latencies, outcomes, failed) for _ in range(concurrency)
+    ))
+    seconds = time.perf_counter() - start
+    stored = len(emails) - sum(failed)
+    return {
+        "emails": stored,
+        "failed_emails": sum(failed),
+        "requests": len(latencies),
+        "seconds": seconds,
+        "emails_per_sec": stored / seconds,
+        "p50_ms": float(np.percentile(latencies, 50)) * 1000 if latencies else None,
+        "p99_ms": float(np.percentile(latencies, 99)) * 1000 if latencies else None,
+        "responses": outcomes
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test a running ingest_server.py with synthetic emails")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--emails", type=int, default=10000)
+    parser.add_argument("--per-request", type=int, default=1, help="emails sent in each request")
+    parser.add_argument("--concurrency", type=int, default=32, help="parallel keep-alive connections")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="corpus seed; by default each run sends new emails, so the store does not skip them as seen")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    emails = [
+        email["email_content"] for batch in iter_sales_email_batches(args.emails, seed=args.seed) for email in batch
+    ]
+    result = asyncio.run(load_test(args.host, args.port, emails, args.per_request, args.concurrency))
+    print(json.dumps(result, indent=2))
+    return 0 if set(result["responses"]) <= {200, 503} else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
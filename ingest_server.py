@@ -0,0 +1,359 @@
+import os
+import json
+import asyncio
+import argparse
+import threading
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date
+from functools import partial
+from urllib.parse import parse_qs
+
+import data_export
+import instrumentation
+import transaction_store
+from extraction import extract_transactions
+from ingestion import message_body, parse_message
+
+DEFAULT_PORT = 8765
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_MAX_WAIT_MS = 50
+
+# Emails accepted but not yet stored before new requests are turned away
+DEFAULT_MAX_PENDING = 20000
+MAX_BODY_BYTES = 32 * 1024 * 1024
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    411: "Length Required",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    503: "Service Unavailable"
+}
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+# A response body produced chunk by chunk and sent with chunked transfer encoding
+StreamingBody = namedtuple("StreamingBody", ["content_type", "filename", "chunks"])
+
+def extract_in_pool(pool, emails, workers=None):
+    """ingest_emails extract hook that runs the rule-based extractor in a worker process"""
+    return pool.submit(extract_transactions, emails).result()
+
+def parse_export_query(query):
+    """Export options from a query string like format=csv&start=2024-01-01&compress=0"""
+    params = {name: values[-1] for name, values in parse_qs(query).items()}
+    file_format = params.get("format", "csv")
+    if file_format not in data_export.EXPORT_FORMATS:
+        raise HTTPError(400, f"format must be one of {', '.join(data_export.EXPORT_FORMATS)}")
+    try:
+        start, end = (date.fromisoformat(params[name]) if name in params else None for name in ("start", "end"))
+    except ValueError as e:
+        raise HTTPError(400, f"invalid date: {e}")
+    compress = params.get("compress", "1").lower() not in ("0", "false", "no")
+    return file_format, start, end, compress
+
+def parse_emails(content_type, body):
+    """Decode a request body into a list of email texts"""
+    content_type = content_type.split(";")[0].strip().lower()
+    if content_type == "application/json":
+        try:
+            payload = json.loads(body)
+        except ValueError as e:
+            raise HTTPError(400, f"invalid JSON: {e}")
+        if isinstance(payload, dict):
+            payload = payload.get("emails", [payload.get("email")])
+        if not isinstance(payload, list) or not all(isinstance(email, str) for email in payload):
+            raise HTTPError(400, 'expected {"email": "..."}, {"emails": [...]} or a list of strings')
+        return payload
+    if content_type == "message/rfc822":
+        return [message_body(parse_message([body]))]
+    return [body.decode("utf-8", errors="replace")]
+
+class IngestServer:
+    """Accept emails over HTTP, micro-batch them and store their transactions"""
+
+    def __init__(self, db_path=transaction_store.TRANSACTIONS_DB, batch_size=DEFAULT_BATCH_SIZE,
+                 max_wait_ms=DEFAULT_MAX_WAIT_MS, workers=None, max_pending=DEFAULT_MAX_PENDING,
+                 history_dir=transaction_store.HISTORY_DIR):
+        self.db_path = db_path
+        self.history_dir = history_dir
+        self.batch_size = batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.pending = 0
+        self.stored = 0
+        self._local = threading.local()
+        self._exporting = threading.Lock()
+
+    def connection(self):
+        """Per-thread store connection; WAL mode lets batches commit from several threads"""
+        if not hasattr(self._local, "conn"):
+            self._local.conn = transaction_store.connect(self.db_path)
+        return self._local.conn
+
+    def store_batch(self, emails):
+        with instrumentation.timer("ingest_batch"):
+            return transaction_store.ingest_emails(self.connection(), emails, extract=self.extract)
+
+    def export_history(self):
+        """Append stored transactions to the columnar history until it has caught up
+
+        Batches finishing while an export runs skip theirs; the running one
+        picks up their rows on its next pass.
+        """
+        try:
+            with instrumentation.timer("ingest_history"):
+                while transaction_store.export_history(self.connection(), self.history_dir):
+                    pass
+        except Exception:
+            instrumentation.increment("ingest_history_errors_total")
+        finally:
+            self._exporting.release()
+
+    async def batcher(self):
+        """Group queued requests until batch_size emails or max_wait has passed, then dispatch"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            size = len(batch[0][0])
+            deadline = loop.time() + self.max_wait
+            while size < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                size += len(item[0])
+
+            # At most one batch per worker is in flight; the queue absorbs the rest
+            await self.slots.acquire()
+            asyncio.create_task(self.run_batch(batch, size))
+
+    async def run_batch(self, batch, size):
+        emails = [email for request_emails, _ in batch for email in request_emails]
+        try:
+            await asyncio.get_running_loop().run_in_executor(self.threads, self.store_batch, emails)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            self.stored += size
+            instrumentation.increment("ingest_emails_total", size)
+            for request_emails, future in batch:
+                if not future.done():
+                    future.set_result(len(request_emails))
+            # Requests are answered before the history is appended to
+            if self.history_dir and self._exporting.acquire(blocking=False):
+                asyncio.get_running_loop().run_in_executor(self.threads, self.export_history)
+        finally:
+            self.pending -= size
+            self.slots.release()
+
+    async def submit(self, emails):
+        """Queue emails for the next batch and wait until they are stored"""
+        # Waiting would never help a request larger than the whole queue
+        if len(emails) > self.max_pending:
+            raise HTTPError(413, f"at most {self.max_pending} emails can be sent in one request")
+        if self.pending + len(emails) > self.max_pending:
+            raise HTTPError(503, "ingest queue is full, retry later")
+        self.pending += len(emails)
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((emails, future))
+        return await future
+
+    def export_chunks(self, table, file_format, start, end, compress):
+        """Stream an export over its own connection, so it reads one consistent snapshot"""
+        conn = transaction_store.connect(self.db_path)
+        try:
+            yield from data_export.export_chunks(conn, table, file_format, start, end, compress)
+        finally:
+            conn.close()
+
+    async def route(self, method, path, query, headers, body):
+        if path.startswith("/export/"):
+            if method != "GET":
+                raise HTTPError(405, "use GET")
+            table = path[len("/export/"):]
+            if table not in data_export.EXPORT_TABLES:
+                raise HTTPError(404, f"no export named {table}")
+            file_format, start, end, compress = parse_export_query(query)
+            return 200, StreamingBody(
+                data_export.export_content_type(file_format, compress),
+                data_export.export_filename(table, file_format, compress),
+                self.export_chunks(table, file_format, start, end, compress)
+            )
+        if path == "/emails":
+            if method != "POST":
+                raise HTTPError(405, "use POST")
+            emails = parse_emails(headers.get("content-type", "text/plain"), body)
+            stored = await self.submit(emails) if emails else 0
+            return 200, {"emails": stored}
+        if path == "/health":
+            return 200, {"pending": self.pending, "stored": self.stored, "max_pending": self.max_pending}
+        if path == "/metrics":
+            return 200, instrumentation.prometheus_text()
+        raise HTTPError(404, f"no route for {path}")
+
+    async def handle(self, reader, writer):
+        """Serve HTTP/1.1 requests on one keep-alive connection"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, path, version = request_line.decode("latin-1").split(maxsplit=2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                body = None
+                try:
+                    if method == "POST" and "content-length" not in headers:
+                        raise HTTPError(411, "Content-Length is required")
+                    try:
+                        length = int(headers.get("content-length", 0))
+                    except ValueError:
+                        raise HTTPError(400, "invalid Content-Length")
+                    if length > MAX_BODY_BYTES:
+                        raise HTTPError(413, f"body is larger than {MAX_BODY_BYTES} bytes")
+                    body = await reader.readexactly(length)
+                    path, _, query = path.partition("?")
+                    status, payload = await self.route(method, path, query, headers, body)
+                except HTTPError as e:
+                    status, payload = e.status, {"error": str(e)}
+                except asyncio.IncompleteReadError:
+                    raise
+                except Exception as e:
+                    status, payload = 500, {"error": str(e)}
+                instrumentation.increment("ingest_requests_total", status=status)
+
+                # An unread body would be parsed as the next request, so those connections close
+                keep_alive = headers.get("connection", "").lower() != "close" and body is not None
+                if isinstance(payload, StreamingBody):
+                    keep_alive = await self.respond_stream(writer, payload, keep_alive)
+                else:
+                    self.respond(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def respond(self, writer, status, payload, keep_alive):
+        if isinstance(payload, str):
+            body, content_type = payload.encode(), "text/plain; version=0.0.4"
+        else:
+            body, content_type = json.dumps(payload).encode(), "application/json"
+        head = [
+            f"HTTP/1.1 {status} {REASONS[status]}",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {len(body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}"
+        ]
+        if status == 503:
+            head.append("Retry-After: 1")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+
+    async def respond_stream(self, writer, payload, keep_alive):
+        """Send a StreamingBody chunk by chunk; return whether the connection can stay open
+
+        Chunks are produced on the worker threads and each is drained before the
+        next is read, so a slow client holds back the export instead of memory
+        filling up. Failures after the headers are sent cut the response short.
+        """
+        loop = asyncio.get_running_loop()
+        chunks = iter(payload.chunks)
+        head = [
+            "HTTP/1.1 200 OK",
+            f"Content-Type: {payload.content_type}",
+            f'Content-Disposition: attachment; filename="{payload.filename}"',
+            "Transfer-Encoding: chunked",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}"
+        ]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+        try:
+            while True:
+                chunk = await loop.run_in_executor(self.threads, next, chunks, None)
+                if chunk is None:
+                    break
+                writer.write(f"{len(chunk):x}\r\n".encode("latin-1") + chunk + b"\r\n")
+                await writer.drain()
+        except Exception:
+            instrumentation.increment("ingest_export_errors_total")
+            return False
+        finally:
+            await loop.run_in_executor(self.threads, chunks.close)
+        writer.write(b"0\r\n\r\n")
+        return keep_alive
+
+    async def serve(self, host="127.0.0.1", port=DEFAULT_PORT, ready=None):
+        self.queue = asyncio.Queue()
+        self.slots = asyncio.Semaphore(self.workers)
+        context = multiprocessing.get_context('spawn')
+        # One thread more than batches in flight, for the history export
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as pool, \
+                ThreadPoolExecutor(max_workers=self.workers + 1) as threads:
+            self.extract = partial(extract_in_pool, pool)
+            self.threads = threads
+            batcher = asyncio.create_task(self.batcher())
+            server = await asyncio.start_server(self.handle, host, port)
+            print(f"Ingesting on http://{host}:{server.sockets[0].getsockname()[1]}/emails")
+            if ready is not None:
+                ready.set()
+            try:
+                async with server:
+                    await server.serve_forever()
+            finally:
+                batcher.cancel()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Local HTTP endpoint that micro-batches emails into the transaction store")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--db", default=transaction_store.TRANSACTIONS_DB, help="transaction store to write to")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="emails per extraction batch")
+    parser.add_argument("--max-wait-ms", type=float, default=DEFAULT_MAX_WAIT_MS,
+                        help="longest a request waits for its batch to fill")
+    parser.add_argument("--workers", type=int, default=None, help="extraction processes and batches in flight")
+    parser.add_argument("--max-pending", type=int, default=DEFAULT_MAX_PENDING,
+                        help="queued emails before requests are rejected with 503")
+    parser.add_argument("--history-dir", default=transaction_store.HISTORY_DIR,
+                        help='columnar history appended to after each batch; "" to turn off')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    server = IngestServer(
+        db_path=args.db,
+        batch_size=args.batch_size,
+        max_wait_ms=args.max_wait_ms,
+        workers=args.workers,
+        max_pending=args.max_pending,
+        history_dir=args.history_dir
+    )
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import os
+import zipfile
+from email import policy
+from email.parser import BytesFeedParser
+from itertools import islice
+
+EMAIL_EXTENSIONS = ('.txt', '.eml', '.mbox', '.zip')
+
+def parse_message(lines):
+    """Parse raw message lines into an email message"""
+    parser = BytesFeedParser(policy=policy.default)
+    for line in lines:
+        parser.feed(line)
+    return parser.close()
+
+def message_body(message):
+    """Return the text body of an email message, preferring plain text"""
+    part = message.get_body(preferencelist=('plain', 'html'))
+    if part is None:
+        return ""
+    try:
+        return part.get_content()
+    except (LookupError, UnicodeDecodeError):
+        return part.get_payload(decode=True).decode('utf-8', errors='replace')
+
+def iter_mbox_bodies(fileobj):
+    """Yield message bodies from an mbox stream one message at a time"""
+    message_lines = None
+    for line in fileobj:
+        if line.startswith(b'From '):
+            if message_lines:
+                yield message_body(parse_message(message_lines))
+            message_lines = []
+        elif message_lines is not None:
+            message_lines.append(line)
+    if message_lines:
+        yield message_body(parse_message(message_lines))
+
+def iter_zip_bodies(fileobj):
+    """Yield message bodies from every supported file inside a zip archive"""
+    with zipfile.ZipFile(fileobj) as archive:
+        for info in archive.infolist():
+            if info.is_dir():
+                continue
+            with archive.open(info) as member:
+                yield from iter_email_bodies(info.filename, member)
+
+def iter_email_bodies(name, fileobj):
+    """Yield email bodies from a binary file object, dispatching on the file extension"""
+    extension = os.path.splitext(name)[1].lower()
+    if extension == '.txt':
+        yield fileobj.read().decode('utf-8', errors='replace')
+    elif extension == '.eml':
+        yield message_body(parse_message(fileobj))
+    elif extension == '.mbox':
+        yield from iter_mbox_bodies(fileobj)
+    elif extension == '.zip':
+        yield from iter_zip_bodies(fileobj)
+
+def iter_uploaded_emails(uploaded_files):
+    """Lazily yield email bodies from a list of uploaded files"""
+    for uploaded_file in uploaded_files:
+        uploaded_file.seek(0)
+        yield from iter_email_bodies(uploaded_file.name, uploaded_file)
+
+def iter_chunks(items, chunk_size):
+    """Group an iterable into lists of at most chunk_size items"""
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, chunk_size))
+        if not chunk:
+            return
+        yield chunk
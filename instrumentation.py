@@ -0,0 +1,147 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+from functools import wraps
+
+# Set CARBON_INSTRUMENTATION=0 to turn every hook below into a no-op
+ENABLED = os.environ.get("CARBON_INSTRUMENTATION", "1") != "0"
+
+# One JSON record per page render; CARBON_REQUEST_LOG moves it
+REQUEST_LOG = os.environ.get(
+    "CARBON_REQUEST_LOG",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "request_log.jsonl")
+)
+
+# When set, the Prometheus text exposition is rewritten here after every request
+PROMETHEUS_FILE = os.environ.get("CARBON_PROMETHEUS_FILE")
+
+_lock = threading.Lock()
+_timers = {}
+_counters = {}
+_local = threading.local()
+_disabled = nullcontext()
+
+def record_duration(stage, seconds):
+    """Add one timed run of a stage to the totals and the current request"""
+    with _lock:
+        stats = _timers.setdefault(stage, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += seconds
+        stats[2] = max(stats[2], seconds)
+
+    request = getattr(_local, "request", None)
+    if request is not None:
+        request["stages"][stage] = request["stages"].get(stage, 0.0) + seconds * 1000
+
+@contextmanager
+def _timer(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_duration(stage, time.perf_counter() - start)
+
+def timer(stage):
+    """Context manager that times a block as the given stage"""
+    return _timer(stage) if ENABLED else _disabled
+
+def timed(stage):
+    """Decorator that times every call of a function as the given stage"""
+    def decorate(function):
+        if not ENABLED:
+            return function
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record_duration(stage, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+def increment(name, value=1, **labels):
+    """Add to a counter, optionally split by labels"""
+    if not ENABLED:
+        return
+
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+    request = getattr(_local, "request", None)
+    if request is not None:
+        label = format_metric(name, key[1])
+        request["counters"][label] = request["counters"].get(label, 0) + value
+
+@contextmanager
+def request_scope(page):
+    """Collect the stages and counters of one app run and log them as a JSONL record"""
+    if not ENABLED:
+        yield
+        return
+
+    request = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "page": page,
+        "stages": {},
+        "counters": {}
+    }
+    _local.request = request
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _local.request = None
+        request["duration_ms"] = (time.perf_counter() - start) * 1000
+        write_request(request)
+        if PROMETHEUS_FILE:
+            write_prometheus(PROMETHEUS_FILE)
+
+def write_request(request, path=None):
+    """Append one request record to the JSONL log"""
+    line = json.dumps(request) + "\n"
+    with _lock:
+        with open(path or REQUEST_LOG, "a") as f:
+            f.write(line)
+
+def format_metric(name, labels):
+    """Render a metric name with its labels in Prometheus syntax"""
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+def prometheus_text():
+    """Render every timer and counter in the Prometheus text exposition format"""
+    with _lock:
+        timers = {stage: list(stats) for stage, stats in _timers.items()}
+        counters = dict(_counters)
+
+    lines = []
+    if timers:
+        lines.append("# TYPE carbon_stage_seconds summary")
+        for stage, (count, total, _) in sorted(timers.items()):
+            lines.append(f'carbon_stage_seconds_count{{stage="{stage}"}} {count}')
+            lines.append(f'carbon_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+        lines.append("# TYPE carbon_stage_seconds_max gauge")
+        for stage, (_, _, longest) in sorted(timers.items()):
+            lines.append(f'carbon_stage_seconds_max{{stage="{stage}"}} {longest:.6f}')
+
+    names = sorted({name for name, _ in counters})
+    for name in names:
+        lines.append(f"# TYPE carbon_{name} counter")
+        for (counter, labels), value in sorted(counters.items()):
+            if counter == name:
+                lines.append(f"{format_metric('carbon_' + name, labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+def write_prometheus(path):
+    """Atomically replace a Prometheus textfile with the current metrics"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(prometheus_text())
+    os.replace(tmp_path, path)
@@ -0,0 +1,23 @@
+import importlib
+
+class LazyModule:
+    """Stand-in for a module that imports it on first attribute access"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        # Not registered in sys.modules, so tools that scan loaded modules
+        # (Streamlit's file watcher, inspect) do not trigger the import
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+def lazy_import(name):
+    """Return a module proxy whose import is deferred until first use"""
+    return LazyModule(name)
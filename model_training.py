@@ -1,64 +1,149 @@
 import random
 import json
-import spacy
-from spacy.tokens import DocBin
-from spacy.training import Example
+import time
+import uuid
+import argparse
+from datetime import date
+import numpy as np
+import pandas as pd
 from faker import Faker
 import os
+from catalog import products_data
 
-# Initialize Faker
-fake = Faker()
+# Names are drawn from fixed pools so generation cost does not depend on Faker per row
+NAME_POOL_SIZE = 2000
+ORDER_ID_MULTIPLIER = 0x9E3779B97F4A7C15
 
-# Product categories with carbon footprint data
-products_data = {
-    "Laptop": {"category": "Electronics", "base_footprint": 300},
-    "Smartphone": {"category": "Electronics", "base_footprint": 100},
-    "Headphones": {"category": "Electronics", "base_footprint": 30},
-    "Smartwatch": {"category": "Electronics", "base_footprint": 50},
-    "Tablet": {"category": "Electronics", "base_footprint": 150},
-    "Camera": {"category": "Electronics", "base_footprint": 80},
-    "Coffee Maker": {"category": "Appliances", "base_footprint": 120},
-    "Air Purifier": {"category": "Appliances", "base_footprint": 200},
-    "Electric Kettle": {"category": "Appliances", "base_footprint": 60},
-    "Vacuum Cleaner": {"category": "Appliances", "base_footprint": 180}
-}
+def name_pools(seed):
+    """Seeded pools of first and last names to combine at random"""
+    pool_fake = Faker()
+    pool_fake.seed_instance(seed)
+    first_names = np.array([pool_fake.first_name() for _ in range(NAME_POOL_SIZE)], dtype=object)
+    last_names = np.array([pool_fake.last_name() for _ in range(NAME_POOL_SIZE)], dtype=object)
+    return first_names, last_names
 
-def generate_sales_emails(num_emails=1000):
-    emails = []
-    for _ in range(num_emails):
-        product = random.choice(list(products_data.keys()))
-        customer_name = fake.name()
-        order_id = fake.unique.uuid4()
-        amount = f"${random.uniform(20, 2000):.2f}"
-        date = fake.date_this_year().strftime("%Y-%m-%d")
+def iter_sales_email_batches(num_emails, batch_size=100000, seed=0):
+    """Yield batches of labeled emails drawn in vectorized form from seeded pools"""
+    rng = np.random.default_rng(seed)
+    first_names, last_names = name_pools(seed)
+    products = np.array(list(products_data), dtype=object)
+    categories = np.array([products_data[p]["category"] for p in products], dtype=object)
+    footprints = np.array([products_data[p]["base_footprint"] for p in products])
+    
+    year_start = date(date.today().year, 1, 1)
+    days_so_far = (date.today() - year_start).days + 1
+    
+    # Order IDs are a per-run random prefix plus the email counter scrambled by an
+    # odd multiplier, which is a bijection mod 2**62, so they are unique without a seen-set
+    prefix = int(rng.integers(0, 2**63)) << 64
+    mask = int(rng.integers(0, 2**62))
+    
+    for offset in range(0, num_emails, batch_size):
+        size = min(batch_size, num_emails - offset)
+        product_idx = rng.integers(0, len(products), size)
+        names = first_names[rng.integers(0, NAME_POOL_SIZE, size)] + " " + last_names[rng.integers(0, NAME_POOL_SIZE, size)]
+        amounts = rng.uniform(20, 2000, size)
+        dates = np.datetime64(year_start) + rng.integers(0, days_so_far, size).astype("timedelta64[D]")
+        
+        batch = []
+        for i in range(size):
+            product = products[product_idx[i]]
+            customer_name = names[i]
+            order_id = str(uuid.UUID(int=prefix | ((offset + i) * ORDER_ID_MULTIPLIER + mask) % 2**62, version=4))
+            amount = f"${amounts[i]:.2f}"
+            purchase_date = str(dates[i])
+            
+            email_content = (
+                f"Hello {customer_name},\n\n"
+                f"Thank you for purchasing the {product}. Your order ID is {order_id}. "
+                f"The total amount of {amount} was successfully processed on {purchase_date}. "
+                "We'll notify you once your item ships.\n\n"
+                "Best Regards,\nSales Team"
+            )
+            
+            batch.append({
+                "customer_name": customer_name,
+                "product": product,
+                "order_id": order_id,
+                "amount": amount,
+                "date": purchase_date,
+                "email_content": email_content,
+                "category": categories[product_idx[i]],
+                "carbon_footprint": footprints[product_idx[i]].item()
+            })
+        yield batch
 
-        email_content = (
-            f"Hello {customer_name},\n\n"
-            f"Thank you for purchasing the {product}. Your order ID is {order_id}. "
-            f"The total amount of {amount} was successfully processed on {date}. "
-            "We'll notify you once your item ships.\n\n"
-            "Best Regards,\nSales Team"
-        )
+def write_email_shards(output_dir, num_emails, shard_size=100000, seed=0, file_format="jsonl"):
+    """Stream generated emails to JSONL, Parquet or Arrow shards, one batch in memory at a time"""
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for shard, batch in enumerate(iter_sales_email_batches(num_emails, shard_size, seed)):
+        path = os.path.join(output_dir, f"emails-{shard:05d}.{file_format}")
+        if file_format in ("parquet", "arrow"):
+            from columnar_store import write_corpus
+            write_corpus(batch, path, file_format)
+        else:
+            with open(path, "w") as f:
+                f.writelines(json.dumps(email) + "\n" for email in batch)
+        paths.append(path)
+    return paths
+
+# Generated email fields and the NER labels they are annotated with
+ENTITY_FIELDS = [
+    ("product", "Product_Name"),
+    ("amount", "Amount"),
+    ("date", "Date"),
+    ("order_id", "Order_ID")
+]
 
-        emails.append({
-            "customer_name": customer_name,
-            "product": product,
-            "order_id": order_id,
-            "amount": amount,
-            "date": date,
-            "email_content": email_content,
-            "category": products_data[product]["category"],
-            "carbon_footprint": products_data[product]["base_footprint"]
-        })
-    return emails
+def annotate_email(email):
+    """Return the email text and character-offset entities for its known fields"""
+    text = email["email_content"]
+    entities = []
+    for field, label in ENTITY_FIELDS:
+        value = email.get(field)
+        if value:
+            start = text.find(value)
+            if start != -1:
+                entities.append((start, start + len(value), label))
+    return text, entities
 
-def train_model(output_dir):
-    # Generate synthetic data
-    emails = generate_sales_emails()
+def build_docbin(nlp, emails, path):
+    """Annotate emails once and serialize them to a .spacy DocBin file"""
+    from spacy.tokens import DocBin
     
-    # Save the generated emails
-    with open(os.path.join(output_dir, "synthetic_sales_emails.json"), "w") as f:
-        json.dump(emails, f, indent=4)
+    doc_bin = DocBin()
+    for email in emails:
+        text, entities = annotate_email(email)
+        doc = nlp.make_doc(text)
+        spans = [doc.char_span(start, end, label=label, alignment_mode="contract") for start, end, label in entities]
+        doc.ents = [span for span in spans if span is not None]
+        doc_bin.add(doc)
+    doc_bin.to_disk(path)
+    return path
+
+def load_examples(nlp, path):
+    """Load training examples from a .spacy DocBin file"""
+    from spacy.tokens import DocBin
+    from spacy.training import Example
+    
+    docs = DocBin().from_disk(path).get_docs(nlp.vocab)
+    return [Example(nlp.make_doc(doc.text), doc) for doc in docs]
+
+def train_model(output_dir, num_emails=1000, n_iter=20, dropout=0.2, patience=3, dev_fraction=0.1, corpus=None):
+    # spaCy is only needed for training, not for generating emails
+    import spacy
+    from spacy.util import minibatch, compounding
+    from columnar_store import read_corpus, write_corpus
+    
+    if corpus:
+        # Only the text and the annotated fields are read from the columnar corpus
+        columns = ["email_content"] + [field for field, _ in ENTITY_FIELDS]
+        emails = read_corpus(corpus, columns=columns).to_dict("records")
+    else:
+        # Generate synthetic data and save it as a columnar corpus
+        emails = [email for batch in iter_sales_email_batches(num_emails) for email in batch]
+        write_corpus(emails, os.path.join(output_dir, "synthetic_sales_emails.parquet"))
     
     # Save product carbon footprint data
     product_df = pd.DataFrame([
@@ -69,67 +154,81 @@ def train_model(output_dir):
     
     # Initialize spaCy model
     nlp = spacy.blank("en")
+    ner = nlp.add_pipe("ner")
+    for _, label in ENTITY_FIELDS:
+        ner.add_label(label)
     
-    # Extract entities from emails
-    train_data = []
-    for email in emails:
-        text = email["email_content"]
-        entities = []
-        
-        # Extract product
-        if "product" in email:
-            start = text.find(email["product"])
-            if start != -1:
-                entities.append((start, start + len(email["product"]), "Product_Name"))
-        
-        # Extract amount
-        if "amount" in email:
-            start = text.find(email["amount"])
-            if start != -1:
-                entities.append((start, start + len(email["amount"]), "Amount"))
-        
-        # Extract date
-        if "date" in email:
-            start = text.find(email["date"])
-            if start != -1:
-                entities.append((start, start + len(email["date"]), "Date"))
-        
-        # Extract order ID
-        if "order_id" in email:
-            start = text.find(email["order_id"])
-            if start != -1:
-                entities.append((start, start + len(email["order_id"]), "Order_ID"))
-        
-        train_data.append((text, {"entities": entities}))
-    
-    # Set up NER pipeline
-    if "ner" not in nlp.pipe_names:
-        ner = nlp.add_pipe("ner")
-    
-    # Add labels
-    for _, annotations in train_data:
-        for ent in annotations.get("entities"):
-            ner.add_label(ent[2])
+    # Annotate once into DocBin files, holding out a dev split for early stopping
+    random.shuffle(emails)
+    dev_size = max(1, int(len(emails) * dev_fraction))
+    dev_path = build_docbin(nlp, emails[:dev_size], os.path.join(output_dir, "dev.spacy"))
+    train_path = build_docbin(nlp, emails[dev_size:], os.path.join(output_dir, "train.spacy"))
+    dev_examples = load_examples(nlp, dev_path)
+    train_examples = load_examples(nlp, train_path)
     
     # Train the model
-    n_iter = 20
-    nlp.initialize()
+    nlp.initialize(lambda: train_examples)
+    model_dir = os.path.join(output_dir, "email_parser_model")
+    best_score, best_iteration = -1.0, 0
     
     for itn in range(n_iter):
-        random.shuffle(train_data)
+        random.shuffle(train_examples)
         losses = {}
-        for text, annotations in train_data:
-            doc = nlp.make_doc(text)
-            example = Example.from_dict(doc, annotations)
-            nlp.update([example], losses=losses)
-        print(f"Iteration {itn + 1} - Loss: {losses}")
-    
-    # Save the model
-    nlp.to_disk(os.path.join(output_dir, "email_parser_model"))
+        start = time.perf_counter()
+        for batch in minibatch(train_examples, size=compounding(4.0, 64.0, 1.001)):
+            nlp.update(batch, drop=dropout, losses=losses)
+        elapsed = time.perf_counter() - start
+        
+        score = nlp.evaluate(dev_examples)["ents_f"] or 0.0
+        print(
+            f"Iteration {itn + 1} - Loss: {losses} - Dev F1: {score:.3f} - "
+            f"{len(train_examples) / elapsed:.0f} examples/sec"
+        )
+        
+        # Keep the best model on disk and stop once the dev score stops improving
+        if score > best_score:
+            best_score, best_iteration = score, itn
+            nlp.to_disk(model_dir)
+        elif itn - best_iteration >= patience:
+            print(f"Stopping early after {itn + 1} iterations")
+            break
     
-    return nlp
+    return spacy.load(model_dir)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Train the email entity recognizer on synthetic emails")
+    parser.add_argument("--output-dir", default="models")
+    parser.add_argument("--num-emails", type=int, default=1000)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--dropout", type=float, default=0.2)
+    parser.add_argument("--patience", type=int, default=3, help="iterations without dev improvement before stopping")
+    parser.add_argument("--generate-only", action="store_true",
+                        help="stream --num-emails labeled emails to shards instead of training")
+    parser.add_argument("--shard-size", type=int, default=100000)
+    parser.add_argument("--format", choices=["jsonl", "parquet", "arrow"], default="jsonl")
+    parser.add_argument("--corpus", help="train on a Parquet or Arrow corpus instead of generating emails")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
 
 if __name__ == "__main__":
-    output_dir = "models"
-    os.makedirs(output_dir, exist_ok=True)
-    trained_model = train_model(output_dir)
+    args = parse_args()
+    os.makedirs(args.output_dir, exist_ok=True)
+    if args.generate_only:
+        paths = write_email_shards(
+            os.path.join(args.output_dir, "synthetic_emails"),
+            args.num_emails,
+            shard_size=args.shard_size,
+            seed=args.seed,
+            file_format=args.format
+        )
+        print(f"Wrote {args.num_emails} emails to {len(paths)} shards")
+        raise SystemExit(0)
+    
+    trained_model = train_model(
+        args.output_dir,
+        num_emails=args.num_emails,
+        n_iter=args.iterations,
+        dropout=args.dropout,
+        patience=args.patience,
+        corpus=args.corpus
+    )
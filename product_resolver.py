@@ -0,0 +1,122 @@
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+from catalog import products_data, load_aliases
+
+# Lowest alias score accepted as a match; 1.0 is every word matching exactly
+MIN_SCORE = 0.75
+
+# Lowest trigram similarity at which a receipt word counts as a catalog word
+MIN_WORD_SIMILARITY = 0.5
+
+CACHE_SIZE = 100000
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+ProductMatch = namedtuple("ProductMatch", ["product", "alias", "score"])
+
+def words(text):
+    """Lowercase alphabetic words, so "Coffee-Maker" and "coffee maker" read the same"""
+    return [word for word in WORD_PATTERN.findall(text.lower()) if word.isalpha()]
+
+def trigrams(word):
+    padded = f" {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class ProductResolver:
+    """Resolve free-text product mentions to catalog products through a trigram index
+
+    Receipt words are matched to catalog words through a trigram inverted
+    index over the catalog vocabulary, and catalog words to aliases through
+    a word index, so a lookup only touches aliases sharing a similar word.
+    """
+
+    def __init__(self, aliases, min_score=MIN_SCORE, min_word_similarity=MIN_WORD_SIMILARITY):
+        self.min_score = min_score
+        self.min_word_similarity = min_word_similarity
+
+        self.alias_names = []
+        self.alias_products = []
+        self.alias_words = []
+        self.word_aliases = {}
+        for alias, product in aliases.items():
+            alias_words = tuple(dict.fromkeys(words(alias)))
+            if not alias_words:
+                continue
+            alias_id = len(self.alias_names)
+            self.alias_names.append(alias)
+            self.alias_products.append(product)
+            self.alias_words.append(alias_words)
+            for word in alias_words:
+                self.word_aliases.setdefault(word, []).append(alias_id)
+        self.max_words = max(map(len, self.alias_words), default=0)
+
+        self.word_trigrams = {word: trigrams(word) for word in self.word_aliases}
+        self.trigram_words = {}
+        for word, grams in self.word_trigrams.items():
+            for gram in grams:
+                self.trigram_words.setdefault(gram, []).append(word)
+
+        # Receipts repeat the same words and product phrases, so both levels are memoized
+        self.similar_words = lru_cache(maxsize=CACHE_SIZE)(self._similar_words)
+        self.resolve_name = lru_cache(maxsize=CACHE_SIZE)(self._resolve_name)
+
+    def _similar_words(self, word):
+        """Catalog words within min_word_similarity of a receipt word, with their Jaccard similarity"""
+        if word in self.word_aliases:
+            return {word: 1.0}
+
+        grams = trigrams(word)
+        overlaps = {}
+        for gram in grams:
+            for candidate in self.trigram_words.get(gram, ()):
+                overlaps[candidate] = overlaps.get(candidate, 0) + 1
+
+        similar = {}
+        for candidate, overlap in overlaps.items():
+            similarity = overlap / (len(grams) + len(self.word_trigrams[candidate]) - overlap)
+            if similarity >= self.min_word_similarity:
+                similar[candidate] = similarity
+        return similar
+
+    def best_match(self, text_words):
+        """Best-scoring alias over every run of up to max_words consecutive words"""
+        matches = [self.similar_words(word) for word in text_words]
+        best_key = best_id = None
+        for start, first in enumerate(matches):
+            if not first:
+                continue
+            for end in range(start + 1, min(start + self.max_words, len(matches)) + 1):
+                window = matches[start:end]
+                candidates = {
+                    alias_id for similar in window for word in similar for alias_id in self.word_aliases[word]
+                }
+                for alias_id in candidates:
+                    alias_words = self.alias_words[alias_id]
+                    matched = sum(max(similar.get(word, 0.0) for similar in window) for word in alias_words)
+                    # Ties go to the earlier mention, then to the more specific alias
+                    key = (matched / max(len(alias_words), len(window)), len(alias_words))
+                    if best_key is None or key > best_key:
+                        best_key, best_id = key, alias_id
+
+        if best_key is None or best_key[0] < self.min_score:
+            return None
+        return ProductMatch(self.alias_products[best_id], self.alias_names[best_id], best_key[0])
+
+    def _resolve_name(self, name):
+        return self.best_match(tuple(words(name)))
+
+    def resolve(self, text):
+        """Best catalog match for the product mentioned anywhere in an email, or None"""
+        return self.best_match(words(text))
+
+@lru_cache(maxsize=None)
+def default_resolver():
+    """Resolver over the loaded catalog and its aliases, built once per process on first use"""
+    return ProductResolver(load_aliases(products_data))
+
+def resolve_product(text):
+    """Catalog product mentioned in an email, or None"""
+    match = default_resolver().resolve(text)
+    return match.product if match else None
@@ -0,0 +1,57 @@
+import re
+import sys
+import json
+import argparse
+import subprocess
+
+IMPORT_TIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+def profile_imports(module="app"):
+    """Import a module in a fresh interpreter under -X importtime and parse the timings"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True
+    )
+    timings = []
+    for line in completed.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            timings.append({
+                "module": name,
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+                "depth": len(indent) // 2
+            })
+    return timings
+
+def startup_report(timings, module="app", top=15):
+    """Summarize total cold-start import time and the slowest top-level imports"""
+    root = next((t for t in timings if t["module"] == module), None)
+    direct = [t for t in timings if t["depth"] == 1]
+    return {
+        "module": module,
+        "total_ms": root["cumulative_ms"] if root else sum(t["self_ms"] for t in timings),
+        "modules_imported": len(timings),
+        "slowest_imports": sorted(direct, key=lambda t: t["cumulative_ms"], reverse=True)[:top]
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report cold-start import time of the Streamlit app")
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--output", help="also write the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = startup_report(profile_imports(args.module), args.module, args.top)
+    print(f"{report['module']}: {report['total_ms']:.1f} ms across {report['modules_imported']} modules")
+    for timing in report["slowest_imports"]:
+        print(f"  {timing['cumulative_ms']:9.1f} ms  {timing['module']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import numpy as np
+
+# Lowest to highest footprint, following the RdYlGn_r colormap
+FOOTPRINT_COLORS = ['#1a9850', '#91cf60', '#d9ef8b', '#fee08b', '#fc8d59', '#d73027']
+
+PAGE_SIZES = [25, 50, 100, 250]
+
+def footprint_quantiles(values, weights=None):
+    """Inner quantile edges that split footprints into equally populated color bands
+
+    weights counts the transactions sharing each value, so the edges can be
+    taken from per-product totals instead of every stored transaction.
+    """
+    if len(values) == 0:
+        return []
+    levels = np.linspace(0, 1, len(FOOTPRINT_COLORS) + 1)[1:-1]
+    if weights is None:
+        return np.quantile(values, levels).tolist()
+    # Inverted CDF from the cumulative weights: the smallest value whose share reaches each level.
+    # np.quantile only takes weights from numpy 2.0 on
+    values = np.asarray(values, dtype=float)
+    order = np.argsort(values, kind='stable')
+    cumulative = np.cumsum(np.asarray(weights, dtype=float)[order])
+    positions = np.searchsorted(cumulative, levels * cumulative[-1], side='left')
+    return values[order][np.minimum(positions, len(values) - 1)].tolist()
+
+def footprint_style(value, quantiles):
+    """CSS for a footprint cell, colored by the band its value falls into"""
+    color = FOOTPRINT_COLORS[int(np.searchsorted(quantiles, value, side='right'))]
+    return f'background-color: {color}; color: #000000'
+
+def page_count(rows, page_size):
+    """Number of pages needed to show rows, at least one"""
+    return max(1, -(-rows // page_size))
+
+def table_page(df, products=None, sort_by=None, ascending=True, page=1, page_size=PAGE_SIZES[1], sort_keys=None):
+    """Filter, sort and slice transactions server-side; return the page and the filtered row count"""
+    if products:
+        df = df[df['product'].isin(products)]
+    if sort_by:
+        key = (sort_keys or {}).get(sort_by, sort_by)
+        df = df.sort_values(key, ascending=ascending, kind='stable')
+
+    start = (page - 1) * page_size
+    return df.iloc[start:start + page_size], len(df)
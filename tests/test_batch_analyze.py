@@ -0,0 +1,99 @@
+import os
+import mailbox
+from email.message import EmailMessage
+
+import pandas as pd
+import pytest
+
+import batch_analyze
+import extraction
+from model_training import iter_sales_email_batches
+
+CHUNK_SIZE = 7
+
+@pytest.fixture(autouse=True)
+def empty_template_cache():
+    extraction.template_cache.clear()
+    yield
+    extraction.template_cache.clear()
+
+def write_mbox(path, bodies):
+    box = mailbox.mbox(str(path))
+    for body in bodies:
+        message = EmailMessage()
+        message["From"] = "sales@example.com"
+        message["Subject"] = "Your order"
+        message.set_content(body)
+        box.add(message)
+    box.close()
+
+@pytest.fixture
+def spool(tmp_path):
+    bodies = [email["email_content"] for batch in iter_sales_email_batches(40, seed=3) for email in batch]
+    spool = tmp_path / "spool"
+    spool.mkdir()
+    # Chunks of 7 end part-way through both mailboxes, so resuming skips within a file
+    write_mbox(spool / "a.mbox", bodies[:18])
+    (spool / "b.txt").write_text(bodies[18])
+    write_mbox(spool / "c.mbox", bodies[19:])
+    return spool
+
+def read_output(output_dir):
+    parts = sorted(os.listdir(output_dir / "transactions"))
+    transactions = pd.concat(
+        [pd.read_csv(output_dir / "transactions" / part) for part in parts], ignore_index=True
+    )
+    return (
+        transactions,
+        pd.read_csv(output_dir / "products.csv"),
+        pd.read_csv(output_dir / "daily.csv")
+    )
+
+def assert_same_output(left, right):
+    for left_frame, right_frame in zip(read_output(left), read_output(right)):
+        pd.testing.assert_frame_equal(left_frame, right_frame)
+
+class Crash(Exception):
+    pass
+
+@pytest.mark.parametrize("chunks", [1, 3, 5])
+def test_resumed_run_matches_a_clean_run(spool, tmp_path, monkeypatch, chunks):
+    clean = tmp_path / "clean"
+    batch_analyze.run_batch([str(spool)], str(clean), workers=1, chunk_size=CHUNK_SIZE)
+
+    # Crash while saving a checkpoint, after its part was written but before it was recorded
+    save_checkpoint = batch_analyze.save_checkpoint
+    saved = []
+    def crashing_save(path, checkpoint):
+        if len(saved) == chunks:
+            raise Crash()
+        saved.append(checkpoint["position"])
+        save_checkpoint(path, checkpoint)
+    monkeypatch.setattr(batch_analyze, "save_checkpoint", crashing_save)
+    resumed = tmp_path / "resumed"
+    with pytest.raises(Crash):
+        batch_analyze.run_batch([str(spool)], str(resumed), workers=1, chunk_size=CHUNK_SIZE)
+    monkeypatch.setattr(batch_analyze, "save_checkpoint", save_checkpoint)
+
+    checkpoint = batch_analyze.run_batch([str(spool)], str(resumed), workers=1, chunk_size=CHUNK_SIZE)
+    assert checkpoint["complete"]
+    assert checkpoint["emails"] == 40
+    assert_same_output(resumed, clean)
+
+def test_checkpoint_is_dropped_when_inputs_or_format_change(spool, tmp_path):
+    output = tmp_path / "output"
+    files = batch_analyze.find_email_files([str(spool)])
+    batch_analyze.run_batch([str(spool)], str(output), workers=1, chunk_size=CHUNK_SIZE)
+    checkpoint_path = str(output / batch_analyze.CHECKPOINT_FILE)
+    assert batch_analyze.load_checkpoint(checkpoint_path, files, "csv")["complete"]
+    assert batch_analyze.load_checkpoint(checkpoint_path, files, "parquet") is None
+
+    # An appended file would otherwise be reported complete with its new emails unread
+    bodies = [email["email_content"] for batch in iter_sales_email_batches(3, seed=4) for email in batch]
+    with open(spool / "b.txt", "a") as f:
+        f.write("\n" + bodies[0])
+    assert batch_analyze.load_checkpoint(checkpoint_path, files, "csv") is None
+    write_mbox(spool / "d.mbox", bodies[1:])
+    checkpoint = batch_analyze.run_batch([str(spool)], str(output), workers=1, chunk_size=CHUNK_SIZE)
+    assert checkpoint["complete"]
+    assert checkpoint["emails"] == 42
@@ -0,0 +1,130 @@
+import re
+
+import pytest
+
+import extraction
+from email_templates import (
+    MAX_ATTEMPTS_PER_LAYOUT, MAX_TEMPLATES_PER_LAYOUT, TemplateCache, field_span, fingerprint
+)
+
+RECEIPT = (
+    "Hello {name},\n\n"
+    "Thank you for purchasing the {product}. Your order ID is {order_id}. "
+    "The total amount of {amount} was successfully processed on {date}.\n\n"
+    "Best Regards,\nSales Team"
+)
+
+def receipt(name="Ann Lee", product="Laptop", order_id="A-1", amount="$843.01", date="2024-05-08"):
+    return RECEIPT.format(name=name, product=product, order_id=order_id, amount=amount, date=date)
+
+def entities(product="Laptop", order_id="A-1", amount="$843.01", date="2024-05-08"):
+    return {"Product_Name": product, "Amount": amount, "Date": date, "Order_ID": order_id}
+
+@pytest.fixture
+def cache():
+    return TemplateCache(
+        {
+            "Product_Name": extraction.mention_pattern,
+            "Amount": extraction.amount_pattern,
+            "Date": extraction.date_pattern,
+            "Order_ID": r"[A-Za-z0-9-]+"
+        },
+        extraction.catalog_product,
+        re.compile(extraction.product_pattern)
+    )
+
+@pytest.fixture
+def empty_template_cache():
+    extraction.template_cache.clear()
+    yield extraction.template_cache
+    extraction.template_cache.clear()
+
+def test_fingerprint_ignores_letters_digits_and_spaces():
+    assert fingerprint(receipt()) == fingerprint(receipt("Mary Ann Smith", "Tablet", "B-22", "$5.00", "2023-01-31"))
+    assert fingerprint(receipt()) != fingerprint(receipt().replace(".\n\n", "!\n\n", 1))
+
+def test_field_span_skips_partial_words():
+    assert field_span("the Laptops. A Laptop.", "Laptop") == (15, 21)
+    assert field_span("the Laptops.", "Laptop") is None
+    assert field_span("paid $5.00 today", "$5.00") == (5, 10)
+
+def test_unknown_layout_is_not_extracted(cache):
+    assert cache.extract(receipt()) is None
+
+def test_learned_template_extracts_other_emails_of_the_layout(cache):
+    assert cache.learn(receipt(), entities())
+    assert cache.extract(receipt("Bob Ray", "Coffee Maker", "Z-9", "$12.50", "2024-01-02")) == {
+        "Product_Name": "Coffee Maker",
+        "Amount": "$12.50",
+        "Date": "2024-01-02",
+        "Order_ID": "Z-9"
+    }
+
+def test_fuzzy_mentions_are_resolved_through_the_template(cache):
+    cache.learn(receipt(), entities())
+    assert cache.extract(receipt(product="coffee maker"))["Product_Name"] == "Coffee Maker"
+
+def test_fields_learned_without_stay_empty(cache):
+    assert cache.learn(receipt(), dict(entities(), Date=""))
+    assert cache.extract(receipt(product="Tablet"))["Date"] == ""
+
+def test_learn_rejects_spans_inside_words(cache):
+    assert not cache.learn(receipt(product="Laptops"), entities())
+    assert len(cache) == 0
+
+def test_learn_rejects_products_outside_the_product_slot(cache):
+    assert not cache.learn(receipt(name="Smartwatch", product="Tablet"), entities(product="Smartwatch"))
+    assert len(cache) == 0
+
+def test_learn_rejects_entities_not_in_the_email(cache):
+    assert not cache.learn(receipt(), entities(order_id="missing"))
+
+def test_learn_skips_emails_a_template_already_covers(cache):
+    assert cache.learn(receipt(), entities())
+    assert not cache.learn(receipt(name="Bob Ray", product="Tablet"), entities(product="Tablet"))
+    assert len(cache) == 1
+
+def test_templates_per_layout_are_bounded(cache):
+    verbs = ["purchasing", "buying", "ordering", "choosing", "picking"]
+    learned = [cache.learn(receipt().replace("purchasing", verb), entities()) for verb in verbs]
+    assert learned == [True] * MAX_TEMPLATES_PER_LAYOUT + [False]
+    assert len(cache) == MAX_TEMPLATES_PER_LAYOUT
+
+def test_learning_attempts_per_layout_are_bounded(cache):
+    resolve_product = cache.resolve_product
+    # Templates that cannot read their own email back are attempts that failed
+    cache.resolve_product = lambda name: None
+    for attempt in range(MAX_ATTEMPTS_PER_LAYOUT):
+        assert not cache.learn(receipt(), entities())
+    cache.resolve_product = resolve_product
+    assert not cache.learn(receipt(), entities())
+    assert len(cache) == 0
+
+def test_oldest_layout_is_dropped(cache):
+    cache.max_layouts = 1
+    first, second = receipt(), receipt().replace("Sales Team", "Sales, Team")
+    assert cache.learn(first, entities())
+    assert cache.learn(second, entities())
+    assert cache.extract(first) is None
+    assert cache.extract(second) is not None
+
+def test_clear(cache):
+    cache.learn(receipt(), entities())
+    cache.clear()
+    assert len(cache) == 0 and cache.extract(receipt()) is None
+
+def test_output_does_not_depend_on_cache_state(empty_template_cache):
+    ambiguous = receipt(name="Smartwatch", product="Tablet")
+    before = extraction.extract_entities(ambiguous)
+    extraction.extract_entities(receipt())
+    assert len(empty_template_cache) == 1
+    assert extraction.extract_entities(ambiguous) == before
+
+def test_batch_output_matches_generic_extraction(empty_template_cache):
+    emails = [receipt(name=f"Customer {i}", product=product, order_id=f"O-{i}")
+              for i, product in enumerate(["Laptop", "Tablet", "Smartwatch", "Camera"] * 3)]
+    emails.append(receipt(name="Smartwatch", product="Tablet", order_id="O-99"))
+    cold = extraction.extract_transactions(emails)
+    warm = extraction.extract_transactions(emails)
+    assert len(empty_template_cache) > 0
+    assert warm.equals(cold)
@@ -0,0 +1,45 @@
+import pytest
+
+import extraction
+
+NON_RECEIPTS = [
+    "Hi team, lunch at noon?\n\nSent from my iPhone",
+    "Can you bring your notebook to the meeting tomorrow?",
+    "Reminder: vacuum the office before Friday.",
+]
+
+RECEIPT = (
+    "Hello Ann Lee,\n\n"
+    "Thank you for purchasing the coffee-maker. Your order ID is AB-123. "
+    "The total amount of $45.99 was successfully processed on 2024-05-08.\n\n"
+    "Sent from my iPhone"
+)
+
+@pytest.fixture(autouse=True)
+def empty_template_cache():
+    extraction.template_cache.clear()
+    yield
+    extraction.template_cache.clear()
+
+@pytest.mark.parametrize("text", NON_RECEIPTS)
+def test_non_receipt_has_no_product(text):
+    assert extraction.extract_entities(text)["Product_Name"] == ""
+
+def test_non_receipts_are_not_transactions():
+    assert extraction.extract_transactions(NON_RECEIPTS).empty
+
+def test_fuzzy_product_is_resolved_next_to_the_order():
+    entities = extraction.extract_entities(RECEIPT)
+    assert entities["Product_Name"] == "Coffee Maker"
+    assert entities["Order_ID"] == "AB-123"
+
+def test_fuzzy_product_ignores_paragraphs_without_anchors():
+    # The iPhone in the signature must not be read as the purchase
+    text = "Hello Ann,\n\nYour order ID is AB-123, total $45.99.\n\nSent from my iPhone"
+    assert extraction.extract_entities(text)["Product_Name"] == ""
+    assert extraction.extract_transactions([text]).empty
+
+def test_batch_keeps_receipts_and_drops_other_mail():
+    transactions = extraction.extract_transactions(NON_RECEIPTS + [RECEIPT])
+    assert list(transactions.index) == [len(NON_RECEIPTS)]
+    assert transactions["product"].tolist() == ["Coffee Maker"]
@@ -0,0 +1,39 @@
+from types import SimpleNamespace
+
+import pytest
+
+import extraction
+import inference
+
+class RecordingModel:
+    """Stands in for the spaCy pipeline, finding no entities and remembering what it was given"""
+
+    def __init__(self):
+        self.texts = []
+
+    def pipe(self, texts, batch_size, n_process):
+        self.texts.extend(texts)
+        return [SimpleNamespace(ents=[]) for _ in texts]
+
+@pytest.fixture(autouse=True)
+def empty_template_cache():
+    extraction.template_cache.clear()
+    yield
+    extraction.template_cache.clear()
+
+def test_only_anchored_misses_reach_the_model():
+    unparsed_receipt = "Hi,\n\nYour order ID is AB-123 for the new gadget.\n\nThanks"
+    emails = [
+        "Thank you for purchasing the Laptop. Your order ID is X-1. The total amount of $999.00 was processed.",
+        "Lunch at noon?\n\nSent from my iPhone",
+        unparsed_receipt,
+    ]
+    model = RecordingModel()
+    transactions = inference.extract_transactions_hybrid(emails, load_model=lambda: model)
+    assert list(transactions["product"]) == ["Laptop"]
+    assert model.texts == [unparsed_receipt]
+
+def test_model_is_not_loaded_without_receipts_to_recover():
+    def load_model():
+        raise AssertionError("model loaded")
+    assert inference.extract_transactions_hybrid(["Sent from my iPhone"], load_model=load_model).empty
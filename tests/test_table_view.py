@@ -0,0 +1,13 @@
+import numpy as np
+
+import table_view
+
+def test_weighted_quantiles_match_repeated_values():
+    values = [300.0, 30.0, 100.0, 50.0, 150.0]
+    weights = [1, 40, 7, 3, 12]
+    levels = np.linspace(0, 1, len(table_view.FOOTPRINT_COLORS) + 1)[1:-1]
+    expected = np.quantile(np.repeat(values, weights), levels, method='inverted_cdf').tolist()
+    assert table_view.footprint_quantiles(values, weights) == expected
+
+def test_quantiles_of_nothing_are_empty():
+    assert table_view.footprint_quantiles([], []) == []
@@ -0,0 +1,72 @@
+import pandas as pd
+import pytest
+
+import extraction
+import transaction_store
+from aggregation import RunningTotals
+from model_training import iter_sales_email_batches
+
+@pytest.fixture(autouse=True)
+def empty_template_cache():
+    extraction.template_cache.clear()
+    yield
+    extraction.template_cache.clear()
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = transaction_store.connect(str(tmp_path / "transactions.db"))
+    yield conn
+    conn.close()
+
+@pytest.fixture
+def emails():
+    return [email["email_content"] for batch in iter_sales_email_batches(200, seed=5) for email in batch]
+
+def stored_count(conn):
+    return conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+
+def assert_rollup_matches_transactions(conn):
+    expected = RunningTotals()
+    expected.update(transaction_store.load_transactions(conn))
+    stored = transaction_store.load_rollup(conn)
+    assert stored.metrics() == pytest.approx(expected.metrics())
+    pd.testing.assert_frame_equal(stored.product_totals(limit=None), expected.product_totals(limit=None))
+    pd.testing.assert_frame_equal(stored.daily_totals(), expected.daily_totals())
+
+def test_repeated_chunk_is_stored_once(conn, emails):
+    transaction_store.ingest_emails(conn, emails)
+    assert stored_count(conn) == len(emails)
+
+    extracted = []
+    def extract(batch, workers=None):
+        extracted.append(len(batch))
+        return extraction.extract_transactions_parallel(batch, workers=workers)
+    hashes = transaction_store.ingest_emails(conn, emails, extract=extract)
+    # Known emails are not even parsed again
+    assert extracted == []
+    assert stored_count(conn) == len(emails)
+    assert len(transaction_store.load_transactions(conn, hashes)) == len(emails)
+    assert_rollup_matches_transactions(conn)
+
+def test_order_resent_in_another_email_is_stored_once(conn, emails):
+    transaction_store.ingest_emails(conn, emails[:10])
+    resent = [email.replace("Hello", "Hi again") for email in emails[:10]]
+    transaction_store.ingest_emails(conn, resent + emails[10:])
+    assert stored_count(conn) == len(emails)
+    assert_rollup_matches_transactions(conn)
+
+def test_receipts_without_order_ids_are_kept(conn):
+    receipts = [
+        f"Thank you for purchasing the Tablet. The total amount of ${amount}.00 was processed on 2024-05-0{day}."
+        for amount, day in [(300, 1), (310, 2), (320, 2)]
+    ]
+    transaction_store.ingest_emails(conn, receipts)
+    transaction_store.ingest_emails(conn, receipts)
+    assert stored_count(conn) == len(receipts)
+    assert_rollup_matches_transactions(conn)
+
+def test_rollups_are_rebuilt_for_older_stores(conn, emails):
+    transaction_store.ingest_emails(conn, emails)
+    conn.executescript("DELETE FROM product_rollup; DELETE FROM daily_rollup;")
+    transaction_store.rebuild_rollups(conn)
+    assert_rollup_matches_transactions(conn)
@@ -0,0 +1,58 @@
+import hashlib
+import sqlite3
+
+import pytest
+
+import transaction_store
+import user_store
+
+RECEIPTS = [
+    "Thank you for purchasing the Laptop. The total amount of $999.00 was processed on 2024-05-08.",
+    "Thank you for purchasing the Tablet. The total amount of $349.50 was processed on 2024-05-09.",
+    "Thank you for purchasing the Camera. Your order ID is ORD-1. The total amount of $59.99 "
+    "was processed on 2024-05-10.",
+]
+
+@pytest.fixture
+def upload(tmp_path):
+    conn = transaction_store.connect(str(tmp_path / "transactions.db"))
+    hashes = transaction_store.ingest_emails(conn, RECEIPTS, extract=transaction_store.extract_transactions_parallel)
+    yield transaction_store.load_transactions(conn, hashes)
+    conn.close()
+
+@pytest.fixture
+def store(tmp_path):
+    store = user_store.UserStore(str(tmp_path / "users.db"))
+    yield store
+    store.close()
+
+def test_repeated_upload_adds_nothing(store, upload):
+    # Two of the receipts have no order ID, so only their email hash tells them apart
+    assert store.add_transactions("alice", upload) == len(RECEIPTS)
+    assert store.add_transactions("alice", upload) == 0
+    assert store.load_rollup("alice").transactions == len(RECEIPTS)
+    assert len(store.load_transactions("alice")) == len(RECEIPTS)
+
+def test_histories_are_per_user(store, upload):
+    store.add_transactions("alice", upload)
+    assert store.add_transactions("bob", upload) == len(RECEIPTS)
+    assert store.load_rollup("bob").transactions == len(RECEIPTS)
+
+def test_legacy_passwords_are_upgraded_on_the_hashing_threads(tmp_path):
+    path = str(tmp_path / "users.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE users (username TEXT PRIMARY KEY, password TEXT, email TEXT)")
+    conn.execute("INSERT INTO users VALUES ('alice', ?, '')", (hashlib.sha256(b"secret").hexdigest(),))
+    conn.commit()
+    conn.close()
+
+    store = user_store.UserStore(path)
+    try:
+        assert store.authenticate("alice", "secret").result()
+        assert not store.authenticate("alice", "wrong").result()
+        assert store.upgraded.result() == 1
+    finally:
+        store.close()
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT password FROM users").fetchone() == (None,)
+    conn.close()
@@ -0,0 +1,335 @@
+import os
+import shutil
+import sqlite3
+import hashlib
+import threading
+
+import pandas as pd
+
+from aggregation import RunningTotals
+from catalog import products_data
+from extraction import extract_transactions_parallel, typed_transactions
+
+# Stored next to users.db
+TRANSACTIONS_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "transactions.db")
+
+# Columnar copy of the stored transactions for date-range reads
+HISTORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "history")
+HISTORY_FORMAT = "arrow"
+
+# Serializes appends and compactions of columnar histories within this process
+_history_lock = threading.Lock()
+
+# Keep IN (...) lists below SQLite's host parameter limit
+QUERY_BATCH_SIZE = 500
+
+# Rows per DataFrame when streaming transactions out of the store
+READ_CHUNK_SIZE = 50000
+
+# Transaction table columns the store can sort a page by, and the stored column for each
+SORT_COLUMNS = {
+    "date": "date",
+    "product": "product",
+    "amount": "amount_cents",
+    "order_id": "order_id",
+    "carbon_footprint": "carbon_footprint"
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS emails (
+    content_hash TEXT PRIMARY KEY
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY,
+    content_hash TEXT NOT NULL,
+    order_id TEXT NOT NULL,
+    date TEXT,
+    product TEXT NOT NULL,
+    amount_cents INTEGER NOT NULL,
+    carbon_footprint REAL NOT NULL
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_order_id
+    ON transactions(order_id) WHERE order_id != '';
+CREATE INDEX IF NOT EXISTS idx_transactions_content_hash ON transactions(content_hash);
+CREATE INDEX IF NOT EXISTS idx_transactions_date ON transactions(date);
+CREATE INDEX IF NOT EXISTS idx_transactions_product ON transactions(product, carbon_footprint);
+CREATE INDEX IF NOT EXISTS idx_transactions_footprint ON transactions(carbon_footprint);
+
+-- Rollups kept current by the trigger below, so dashboard metrics cost
+-- O(products + days) instead of a scan over every stored transaction
+CREATE TABLE IF NOT EXISTS product_rollup (
+    product TEXT PRIMARY KEY,
+    carbon_footprint REAL NOT NULL,
+    transactions INTEGER NOT NULL,
+    amount_cents INTEGER NOT NULL,
+    max_footprint REAL NOT NULL,
+    max_id INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS daily_rollup (
+    date TEXT PRIMARY KEY,
+    carbon_footprint REAL NOT NULL,
+    transactions INTEGER NOT NULL,
+    amount_cents INTEGER NOT NULL
+);
+
+-- Highest transaction id appended to each columnar history, advanced under the write lock
+CREATE TABLE IF NOT EXISTS history_exports (
+    root TEXT PRIMARY KEY,
+    last_id INTEGER NOT NULL
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS transactions_rollup AFTER INSERT ON transactions
+BEGIN
+    INSERT INTO product_rollup
+    VALUES (NEW.product, NEW.carbon_footprint, 1, NEW.amount_cents, NEW.carbon_footprint, NEW.id)
+    ON CONFLICT(product) DO UPDATE SET
+        carbon_footprint = carbon_footprint + excluded.carbon_footprint,
+        transactions = transactions + 1,
+        amount_cents = amount_cents + excluded.amount_cents,
+        max_id = CASE WHEN excluded.max_footprint > max_footprint THEN excluded.max_id ELSE max_id END,
+        max_footprint = MAX(max_footprint, excluded.max_footprint);
+
+    INSERT INTO daily_rollup
+    SELECT NEW.date, NEW.carbon_footprint, 1, NEW.amount_cents WHERE NEW.date IS NOT NULL
+    ON CONFLICT(date) DO UPDATE SET
+        carbon_footprint = carbon_footprint + excluded.carbon_footprint,
+        transactions = transactions + 1,
+        amount_cents = amount_cents + excluded.amount_cents;
+END;
+"""
+
+REBUILD_ROLLUPS = """
+DELETE FROM product_rollup;
+DELETE FROM daily_rollup;
+
+INSERT INTO product_rollup
+SELECT product, SUM(carbon_footprint), COUNT(*), SUM(amount_cents), MAX(carbon_footprint),
+    (SELECT id FROM transactions AS top WHERE top.product = t.product ORDER BY carbon_footprint DESC, id LIMIT 1)
+FROM transactions AS t GROUP BY product;
+
+INSERT INTO daily_rollup
+SELECT date, SUM(carbon_footprint), COUNT(*), SUM(amount_cents)
+FROM transactions WHERE date IS NOT NULL GROUP BY date;
+"""
+
+product_categories = {name: data["category"] for name, data in products_data.items()}
+
+TRANSACTION_COLUMNS = ["date", "product", "amount_cents", "order_id", "carbon_footprint"]
+
+def connect(path=TRANSACTIONS_DB):
+    """Open the transaction store in WAL mode, creating the schema if needed"""
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    
+    # Stores created before the rollup tables existed are backfilled once
+    needs_backfill = conn.execute(
+        "SELECT NOT EXISTS (SELECT 1 FROM product_rollup) AND EXISTS (SELECT 1 FROM transactions)"
+    ).fetchone()[0]
+    if needs_backfill:
+        rebuild_rollups(conn)
+    return conn
+
+def rebuild_rollups(conn):
+    """Recompute the rollup tables from every stored transaction"""
+    conn.executescript("BEGIN;" + REBUILD_ROLLUPS + "COMMIT;")
+
+def hash_email(email_content):
+    """Return the content hash used to deduplicate emails"""
+    return hashlib.sha256(email_content.encode('utf-8')).hexdigest()
+
+def batched(items, size=QUERY_BATCH_SIZE):
+    """Split a list into consecutive slices of at most size items"""
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def known_hashes(conn, hashes):
+    """Return the subset of email hashes already in the store"""
+    known = set()
+    for batch in batched(list(hashes)):
+        placeholders = ",".join("?" * len(batch))
+        rows = conn.execute(
+            f"SELECT content_hash FROM emails WHERE content_hash IN ({placeholders})", batch
+        )
+        known.update(row[0] for row in rows)
+    return known
+
+def transaction_rows(transactions):
+    """(date, product, amount_cents, order_id, carbon_footprint) tuples ready for executemany"""
+    dates = transactions["date"].dt.strftime("%Y-%m-%d")
+    return zip(
+        dates.astype(object).where(dates.notna(), None),
+        transactions["product"].astype(str),
+        transactions["amount_cents"].tolist(),
+        transactions["order_id"],
+        transactions["carbon_footprint"].tolist()
+    )
+
+def ingest_emails(conn, emails, workers=None, extract=extract_transactions_parallel):
+    """Extract and store transactions for emails not seen before; return all email hashes"""
+    hashes = [hash_email(email_content) for email_content in emails]
+    known = known_hashes(conn, hashes)
+
+    new_emails = {}
+    for content_hash, email_content in zip(hashes, emails):
+        if content_hash not in known:
+            new_emails.setdefault(content_hash, email_content)
+
+    if new_emails:
+        transactions = extract(
+            pd.Series(list(new_emails.values()), index=list(new_emails.keys()), dtype=object),
+            workers=workers
+        )
+        rows = (
+            (content_hash, *row) for content_hash, row in zip(transactions.index, transaction_rows(transactions))
+        )
+        with conn:
+            # Orders already stored under another email are skipped by the order_id index
+            conn.executemany(
+                "INSERT OR IGNORE INTO transactions "
+                "(content_hash, date, product, amount_cents, order_id, carbon_footprint) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO emails (content_hash) VALUES (?)",
+                ((content_hash,) for content_hash in new_emails)
+            )
+
+    return hashes
+
+def load_transactions(conn, hashes=None):
+    """Load stored transactions, optionally only those from the given emails
+
+    Transactions loaded by email are indexed by the email's content hash,
+    so callers storing them elsewhere can deduplicate by email too.
+    """
+    columns = ", ".join(TRANSACTION_COLUMNS)
+    if hashes is None:
+        return typed_transactions(
+            pd.read_sql_query(f"SELECT {columns} FROM transactions ORDER BY date, id", conn)
+        )
+
+    frames = []
+    for batch in batched(list(dict.fromkeys(hashes))):
+        placeholders = ",".join("?" * len(batch))
+        frames.append(pd.read_sql_query(
+            f"SELECT content_hash, {columns} FROM transactions WHERE content_hash IN ({placeholders}) ORDER BY id",
+            conn,
+            params=batch,
+            index_col="content_hash"
+        ))
+    if not frames:
+        return typed_transactions(pd.DataFrame(columns=TRANSACTION_COLUMNS, index=pd.Index([], name="content_hash")))
+    return typed_transactions(pd.concat(frames))
+
+def iter_transactions(conn, start=None, end=None, chunk_size=READ_CHUNK_SIZE):
+    """Yield stored transactions in date order as typed DataFrames of at most chunk_size rows
+
+    With a start or end date only dated transactions in the inclusive range
+    are read. At least one, possibly empty, frame is yielded.
+    """
+    columns = ", ".join(TRANSACTION_COLUMNS)
+    if start is None and end is None:
+        cursor = conn.execute(f"SELECT {columns} FROM transactions ORDER BY date, id")
+    else:
+        cursor = conn.execute(
+            f"SELECT {columns} FROM transactions WHERE date BETWEEN ? AND ? ORDER BY date, id",
+            (
+                start.strftime("%Y-%m-%d") if start is not None else "",
+                end.strftime("%Y-%m-%d") if end is not None else "9999-12-31"
+            )
+        )
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            yield typed_transactions(pd.DataFrame(rows, columns=TRANSACTION_COLUMNS))
+            if len(rows) < chunk_size:
+                break
+    finally:
+        cursor.close()
+
+def page_query(table, sort_by, ascending, products=(), conditions=()):
+    """SELECT for one page of a transactions table, filtered by product and sliced with LIMIT/OFFSET"""
+    conditions = list(conditions)
+    if products:
+        conditions.append(f"product IN ({','.join('?' * len(products))})")
+    # The id tie-break runs the same way, so the date and footprint indexes serve the sort
+    direction = "ASC" if ascending else "DESC"
+    return (
+        f"SELECT {', '.join(TRANSACTION_COLUMNS)} FROM {table}"
+        + (f" WHERE {' AND '.join(conditions)}" if conditions else "")
+        + f" ORDER BY {SORT_COLUMNS[sort_by]} {direction}, id {direction} LIMIT ? OFFSET ?"
+    )
+
+def load_page(conn, products=None, sort_by="carbon_footprint", ascending=False, page=1, page_size=50):
+    """One sorted page of stored transactions, read without loading the rest of the history"""
+    products = list(products or [])
+    rows = conn.execute(
+        page_query("transactions", sort_by, ascending, products),
+        [*products, page_size, (page - 1) * page_size]
+    ).fetchall()
+    return typed_transactions(pd.DataFrame(rows, columns=TRANSACTION_COLUMNS))
+
+def export_history(conn, root=HISTORY_DIR, file_format=HISTORY_FORMAT):
+    """Append transactions stored since the last export to the columnar history; return how many
+
+    The watermark is read and advanced in one short write transaction, so
+    exports running at the same time never take the same rows, and the files
+    are written after it commits, so ingestion is not held up by the I/O.
+    Months left with many small files are compacted. Files are written under
+    a lock held by this process only, so one process should export each root.
+    """
+    from columnar_store import compact_transactions, write_transactions
+    
+    root = os.path.abspath(root)
+    columns = ", ".join(TRANSACTION_COLUMNS)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # A deleted dataset is exported again from the start
+        row = conn.execute("SELECT last_id FROM history_exports WHERE root = ?", (root,)).fetchone()
+        last_id = row[0] if row and os.path.isdir(root) else 0
+        new_rows = pd.read_sql_query(
+            f"SELECT id, {columns} FROM transactions WHERE id > ? ORDER BY id", conn, params=[last_id]
+        )
+        if not new_rows.empty:
+            # Created before the watermark commits, so a concurrent export never takes the dataset for deleted
+            os.makedirs(root, exist_ok=True)
+            conn.execute(
+                "INSERT INTO history_exports (root, last_id) VALUES (?, ?) "
+                "ON CONFLICT(root) DO UPDATE SET last_id = excluded.last_id",
+                (root, int(new_rows["id"].max()))
+            )
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    if new_rows.empty:
+        return 0
+    
+    try:
+        with _history_lock:
+            write_transactions(typed_transactions(new_rows), root, file_format)
+            compact_transactions(root, file_format)
+    except BaseException:
+        # The watermark already covers these rows, so the history is dropped and rebuilt by the next export
+        with conn:
+            conn.execute("DELETE FROM history_exports WHERE root = ?", (root,))
+        shutil.rmtree(root, ignore_errors=True)
+        raise
+    return len(new_rows)
+
+def load_rollup(conn):
+    """Read the stored rollups into a RunningTotals without touching the transactions table"""
+    top = conn.execute(
+        "SELECT product, max_footprint FROM product_rollup ORDER BY max_footprint DESC, max_id LIMIT 1"
+    ).fetchone()
+    return RunningTotals.from_totals(
+        conn.execute("SELECT product, carbon_footprint, transactions, amount_cents FROM product_rollup"),
+        conn.execute("SELECT date, carbon_footprint, transactions, amount_cents FROM daily_rollup"),
+        product_categories,
+        *(top or ())
+    )
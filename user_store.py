@@ -0,0 +1,369 @@
+import os
+import re
+import hmac
+import time
+import queue
+import sqlite3
+import hashlib
+import secrets
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+
+import pandas as pd
+
+from aggregation import RunningTotals
+from extraction import typed_transactions
+from transaction_store import TRANSACTION_COLUMNS, page_query, product_categories, transaction_rows
+
+USERS_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "users.db")
+
+# Connections shared by every session in the process; each keeps its prepared statements
+POOL_SIZE = 8
+STATEMENT_CACHE_SIZE = 64
+
+USER_CACHE_TTL = 60
+USER_CACHE_SIZE = 1024
+
+PASSWORD_ITERATIONS = 600000
+SALT_BYTES = 16
+
+# users.db predates salting and stored bare SHA-256 hex digests of passwords
+LEGACY_DIGEST = re.compile(r"[0-9a-f]{64}")
+
+# Hashing is deliberately slow, so a few threads bound how much CPU logins can take
+HASH_WORKERS = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password TEXT,
+    email TEXT,
+    password_hash TEXT
+);
+
+CREATE TABLE IF NOT EXISTS user_transactions (
+    id INTEGER PRIMARY KEY,
+    username TEXT NOT NULL,
+    content_hash TEXT,
+    order_id TEXT NOT NULL,
+    date TEXT,
+    product TEXT NOT NULL,
+    amount_cents INTEGER NOT NULL,
+    carbon_footprint REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_user_transactions_user_date ON user_transactions(username, date);
+CREATE INDEX IF NOT EXISTS idx_user_transactions_user_footprint ON user_transactions(username, carbon_footprint);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_user_transactions_order_id
+    ON user_transactions(username, order_id) WHERE order_id != '';
+CREATE UNIQUE INDEX IF NOT EXISTS idx_user_transactions_content_hash
+    ON user_transactions(username, content_hash);
+
+-- Per-user rollups, so a dashboard reads one user's rows by key however many users there are
+CREATE TABLE IF NOT EXISTS user_product_rollup (
+    username TEXT NOT NULL,
+    product TEXT NOT NULL,
+    carbon_footprint REAL NOT NULL,
+    transactions INTEGER NOT NULL,
+    amount_cents INTEGER NOT NULL,
+    max_footprint REAL NOT NULL,
+    max_id INTEGER NOT NULL,
+    PRIMARY KEY (username, product)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS user_daily_rollup (
+    username TEXT NOT NULL,
+    date TEXT NOT NULL,
+    carbon_footprint REAL NOT NULL,
+    transactions INTEGER NOT NULL,
+    amount_cents INTEGER NOT NULL,
+    PRIMARY KEY (username, date)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS user_transactions_rollup AFTER INSERT ON user_transactions
+BEGIN
+    INSERT INTO user_product_rollup
+    VALUES (NEW.username, NEW.product, NEW.carbon_footprint, 1, NEW.amount_cents, NEW.carbon_footprint, NEW.id)
+    ON CONFLICT(username, product) DO UPDATE SET
+        carbon_footprint = carbon_footprint + excluded.carbon_footprint,
+        transactions = transactions + 1,
+        amount_cents = amount_cents + excluded.amount_cents,
+        max_id = CASE WHEN excluded.max_footprint > max_footprint THEN excluded.max_id ELSE max_id END,
+        max_footprint = MAX(max_footprint, excluded.max_footprint);
+
+    INSERT INTO user_daily_rollup
+    SELECT NEW.username, NEW.date, NEW.carbon_footprint, 1, NEW.amount_cents WHERE NEW.date IS NOT NULL
+    ON CONFLICT(username, date) DO UPDATE SET
+        carbon_footprint = carbon_footprint + excluded.carbon_footprint,
+        transactions = transactions + 1,
+        amount_cents = amount_cents + excluded.amount_cents;
+END;
+"""
+
+# Statements are kept as constants so every pooled connection prepares each one once
+SELECT_USER = "SELECT username, email, password_hash FROM users WHERE username = ?"
+INSERT_USER = "INSERT OR IGNORE INTO users (username, email, password_hash) VALUES (?, ?, ?)"
+SELECT_LEGACY = "SELECT username, password FROM users WHERE password_hash IS NULL AND password IS NOT NULL"
+UPDATE_HASH = "UPDATE users SET password_hash = ?, password = NULL WHERE username = ?"
+INSERT_TRANSACTION = (
+    "INSERT OR IGNORE INTO user_transactions "
+    "(username, content_hash, date, product, amount_cents, order_id, carbon_footprint) VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+SELECT_TRANSACTIONS = (
+    f"SELECT {', '.join(TRANSACTION_COLUMNS)} FROM user_transactions WHERE username = ? ORDER BY date, id"
+)
+SELECT_TRANSACTIONS_BETWEEN = (
+    f"SELECT {', '.join(TRANSACTION_COLUMNS)} FROM user_transactions "
+    "WHERE username = ? AND date BETWEEN ? AND ? ORDER BY date, id"
+)
+SELECT_TOP_PRODUCT = (
+    "SELECT product, max_footprint FROM user_product_rollup WHERE username = ? "
+    "ORDER BY max_footprint DESC, max_id LIMIT 1"
+)
+SELECT_PRODUCT_ROLLUP = (
+    "SELECT product, carbon_footprint, transactions, amount_cents FROM user_product_rollup WHERE username = ?"
+)
+SELECT_DAILY_ROLLUP = (
+    "SELECT date, carbon_footprint, transactions, amount_cents FROM user_daily_rollup WHERE username = ?"
+)
+
+def sha256_hex(password):
+    return hashlib.sha256(password.encode("utf-8")).hexdigest()
+
+def hash_password(password, salt=None, iterations=PASSWORD_ITERATIONS, algorithm="pbkdf2_sha256"):
+    """Salted PBKDF2-SHA256 hash, stored as algorithm$iterations$salt$digest"""
+    salt = salt or secrets.token_bytes(SALT_BYTES)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+    return f"{algorithm}${iterations}${salt.hex()}${digest.hex()}"
+
+def hash_legacy_password(stored):
+    """Hash for a pre-salting users.db password: its SHA-256 digest wrapped in PBKDF2"""
+    if LEGACY_DIGEST.fullmatch(stored):
+        return hash_password(stored, algorithm="pbkdf2_sha256_legacy")
+    return hash_password(stored)
+
+def verify_password(password, password_hash):
+    """Check a password against a stored hash in constant time"""
+    try:
+        algorithm, iterations, salt, digest = password_hash.split("$")
+    except (AttributeError, ValueError):
+        return False
+    if algorithm == "pbkdf2_sha256_legacy":
+        password = sha256_hex(password)
+    elif algorithm != "pbkdf2_sha256":
+        return False
+    expected = hash_password(password, bytes.fromhex(salt), int(iterations))
+    return hmac.compare_digest(expected.rsplit("$", 1)[1], digest)
+
+# Checked when a username is unknown, so a failed login takes as long either way
+DUMMY_HASH = f"pbkdf2_sha256${PASSWORD_ITERATIONS}${'00' * SALT_BYTES}${'00' * 32}"
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire ttl seconds after they are set"""
+
+    def __init__(self, maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+class ConnectionPool:
+    """Thread-safe pool of at most size SQLite connections in WAL mode
+
+    Connections are opened on demand and handed back after use, so concurrent
+    sessions share a few long-lived connections (and their prepared
+    statements) instead of each opening its own.
+    """
+
+    def __init__(self, path=USERS_DB, size=POOL_SIZE):
+        self.path = path
+        self.size = size
+        self.opened = 0
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.path, timeout=30, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection, waiting for one to be returned if all size are in use"""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if self.opened < self.size:
+                    conn = self._open()
+                    self.opened += 1
+            if conn is None:
+                conn = self._idle.get()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+class UserStore:
+    """Users and their transaction histories, safe to share across concurrent sessions"""
+
+    def __init__(self, path=USERS_DB, pool_size=POOL_SIZE, cache_ttl=USER_CACHE_TTL):
+        self.pool = ConnectionPool(path, pool_size)
+        self.users = TTLCache(ttl=cache_ttl)
+        self.hashing = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="password-hash")
+        with self.pool.connection() as conn:
+            self._migrate(conn)
+        # Rehashing is slow, so opening the store does not wait for it; logins do
+        self.upgraded = self.hashing.submit(self._upgrade_legacy_passwords)
+
+    def _migrate(self, conn):
+        """Create the schema, adding columns older users.db files lack"""
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(users)")}
+        if columns and "password_hash" not in columns:
+            conn.execute("ALTER TABLE users ADD COLUMN password_hash TEXT")
+        # Histories stored before emails were tracked keep NULL hashes, which never conflict
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(user_transactions)")}
+        if columns and "content_hash" not in columns:
+            conn.execute("ALTER TABLE user_transactions ADD COLUMN content_hash TEXT")
+        conn.executescript(SCHEMA)
+
+    def _upgrade_legacy_passwords(self):
+        """Replace unsalted passwords with salted hashes, on the hashing threads"""
+        with self.pool.connection() as conn:
+            legacy = conn.execute(SELECT_LEGACY).fetchall()
+        if not legacy:
+            return 0
+        hashes = [(hash_legacy_password(password), username) for username, password in legacy]
+        with self.pool.connection() as conn, conn:
+            conn.executemany(UPDATE_HASH, hashes)
+        for _, username in hashes:
+            self.users.invalidate(username)
+        return len(hashes)
+
+    def close(self):
+        self.hashing.shutdown()
+        self.pool.close()
+
+    def get_user(self, username):
+        """User record as a dict, or None; lookups are cached for cache_ttl seconds"""
+        user = self.users.get(username, False)
+        if user is False:
+            with self.pool.connection() as conn:
+                row = conn.execute(SELECT_USER, (username,)).fetchone()
+            user = dict(zip(("username", "email", "password_hash"), row)) if row else None
+            self.users.set(username, user)
+        return user
+
+    def _register(self, username, password, email):
+        password_hash = hash_password(password)
+        with self.pool.connection() as conn, conn:
+            created = conn.execute(INSERT_USER, (username, email, password_hash)).rowcount == 1
+        self.users.invalidate(username)
+        return created
+
+    def register(self, username, password, email=""):
+        """Create a user on the hashing threads; the Future is False if the name is taken"""
+        if not username or not password:
+            future = Future()
+            future.set_result(False)
+            return future
+        return self.hashing.submit(self._register, username, password, email)
+
+    def _authenticate(self, username, password):
+        # Users with unsalted passwords have no hash to check until the upgrade is done
+        self.upgraded.result()
+        user = self.get_user(username)
+        password_hash = user["password_hash"] if user else None
+        matched = verify_password(password, password_hash or DUMMY_HASH)
+        if matched and password_hash.startswith("pbkdf2_sha256_legacy$"):
+            # The password is known now, so the SHA-256 wrapping can be dropped
+            with self.pool.connection() as conn, conn:
+                conn.execute(UPDATE_HASH, (hash_password(password), username))
+            self.users.invalidate(username)
+        return bool(password_hash) and matched
+
+    def authenticate(self, username, password):
+        """Check credentials on the hashing threads, resolving the Future to True or False"""
+        return self.hashing.submit(self._authenticate, username, password)
+
+    def add_transactions(self, username, transactions):
+        """Append typed transactions to a user's history and return how many were new
+
+        transactions are indexed by the content hash of their email, as
+        transaction_store.load_transactions returns them. Emails and orders
+        already in the history are skipped, so repeating an upload is harmless.
+        """
+        rows = zip(transactions.index, transaction_rows(transactions))
+        with self.pool.connection() as conn, conn:
+            return conn.executemany(
+                INSERT_TRANSACTION, ((username, content_hash, *row) for content_hash, row in rows)
+            ).rowcount
+
+    def load_transactions(self, username, start=None, end=None):
+        """A user's transactions, optionally within an inclusive date range, via the (user, date) index"""
+        with self.pool.connection() as conn:
+            if start is None and end is None:
+                rows = conn.execute(SELECT_TRANSACTIONS, (username,)).fetchall()
+            else:
+                # Undated transactions fall outside every range
+                start = start.strftime("%Y-%m-%d") if start is not None else ""
+                end = end.strftime("%Y-%m-%d") if end is not None else "9999-12-31"
+                rows = conn.execute(SELECT_TRANSACTIONS_BETWEEN, (username, start, end)).fetchall()
+        return typed_transactions(pd.DataFrame(rows, columns=TRANSACTION_COLUMNS))
+
+    def load_page(self, username, products=None, sort_by="carbon_footprint", ascending=False, page=1, page_size=50):
+        """One sorted page of a user's transactions, read without loading the rest of their history"""
+        products = list(products or [])
+        query = page_query("user_transactions", sort_by, ascending, products, ["username = ?"])
+        with self.pool.connection() as conn:
+            rows = conn.execute(query, [username, *products, page_size, (page - 1) * page_size]).fetchall()
+        return typed_transactions(pd.DataFrame(rows, columns=TRANSACTION_COLUMNS))
+
+    def load_rollup(self, username):
+        """A user's dashboard totals, read by key from the per-user rollup tables"""
+        with self.pool.connection() as conn:
+            top = conn.execute(SELECT_TOP_PRODUCT, (username,)).fetchone()
+            return RunningTotals.from_totals(
+                conn.execute(SELECT_PRODUCT_ROLLUP, (username,)).fetchall(),
+                conn.execute(SELECT_DAILY_ROLLUP, (username,)).fetchall(),
+                product_categories,
+                *(top or ())
+            )